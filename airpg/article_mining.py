@@ -1,99 +1,217 @@
+import time
 import logging
-import re
+import string
+from collections import OrderedDict
+from pathlib import Path
+
+# Taxonomic expressions that occur within species names
+_TAX_EXPR = frozenset(("sp.", "x", "var.", "subsp.", "f."))
+
+class _CleaningTable(dict):
+    '''
+    Translation table for str.translate that deletes all characters that cannot occur in taxon
+    names, i.e. everything except ASCII letters, digits, '.', '-', ':' and whitespace.
+    Code points are classified on first use and cached, so the table never covers more
+    than the characters actually seen.
+    '''
+    _allowed = frozenset(string.ascii_letters + string.digits + ".-:")
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        self[codepoint] = codepoint if (char in self._allowed or char.isspace()) else None
+        return self[codepoint]
+
+_CLEAN_TABLE = _CleaningTable()
+
+class _LRUCache(OrderedDict):
+    '''
+    Dictionary that holds at most maxsize items; once it is full, the least recently used item is evicted
+    '''
+
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last = False)
+
+# Process-wide caches of NCBI Taxonomy lookups (name -> list of taxids, taxid -> rank)
+_TAXID_CACHE = _LRUCache(200000)
+_RANK_CACHE = _LRUCache(200000)
+
+# NCBITaxa instance shared by all taxonomy lookups of the process; initialized on first use
+_NCBI_TAXA = None
+TAXA_SQLITE = Path.home() / ".etetoolkit" / "taxa.sqlite"  # Local taxonomy database of ete3
+
+def get_ncbi_taxa():
+    '''
+    Returns the NCBITaxa instance of the process, initializing it on first use. The local taxonomy database
+    is updated if it is older than one month, which is checked only once per process; if the database does
+    not exist yet, NCBITaxa downloads it.
+    '''
+    global _NCBI_TAXA
+    if _NCBI_TAXA is None:
+        from ete3 import NCBITaxa  # ete3 is only imported once a taxonomy lookup is needed, since importing it is slow
+        _NCBI_TAXA = NCBITaxa()
+        try:
+            db_age = time.time() - TAXA_SQLITE.stat().st_mtime
+        except FileNotFoundError:
+            db_age = 0  # No database to be updated
+        if db_age > 2592000:
+            _NCBI_TAXA.update_taxonomy_database()
+    return _NCBI_TAXA
 
 class ArticleMining:
 
     def __init__(self, logger):
         self.log = logger or logging.getLogger(__name__ + ".ArticleMining")
 
-    def get_abstract_text(self, article):
+    def get_abstract_text_and_keywords(self, article):
         '''
-        Parses a pubmed article for its abstract text
+        Parses a pubmed article for its abstract text and its keywords in a single pass
+        over the XML tree; returns both as a tuple
         '''
-        text = ""
-        for elem in article.xml.findall(".//AbstractText"):
-            text += elem.text + "\n"
-        return text
+        text = []
+        keywords = []
+        for elem in article.xml.iter():
+            if not elem.text:
+                continue
+            if elem.tag == "AbstractText":
+                text.append(elem.text + "\n")
+            elif elem.tag == "Keyword":
+                keywords.append(elem.text)
+        return "".join(text), keywords
 
-    def get_article_keywords(self, article):
+    def get_species_candidates(self, article, text_and_keywords = None):
         '''
-        Parses a pubmed article for its keywords
+        Parses a pubmed article's abstract text and keywords for strings that may be species names
+        Params:
+         - article: PubMedRecord
+         - text_and_keywords: (optional) tuple of abstract text and keywords already parsed from the article
         '''
-        keywords = []
-        for elem in article.xml.findall(".//Keyword"):
-            keywords.append(elem.text)
-        #self.log.debug("Found %s keywords." % str(len(keywords)))
-        return keywords
+        abstract_text, keywords = text_and_keywords or self.get_abstract_text_and_keywords(article)
+        abstract_text += "\n".join(keywords)  # Each abstract text paragraph already ends with a newline
+        return self.construct_species_query(abstract_text)
 
-    def get_species_from_pubmed_article(self, article, ncbi):
+    def get_genus_candidates(self, article, text_and_keywords = None):
         '''
-        Parses a pubmed article for species names
+        Parses a pubmed article's abstract text and keywords for strings that may be genus names
+        Params:
+         - article: PubMedRecord
+         - text_and_keywords: (optional) tuple of abstract text and keywords already parsed from the article
         '''
-        species = set()
-        abstract_text = self.get_abstract_text(article)
-        keywords = self.get_article_keywords(article)
-        for keyword in keywords:
-            abstract_text += keyword + "\n"
-        ncbi_query_results = ncbi.get_name_translator(self.construct_species_query(abstract_text))
-        for name, id in ncbi_query_results.items():
-            # We're only interested in species-rank taxons
-            if ncbi.get_rank(id)[id[0]] == "species":
-                species.add(name)
+        abstract_text, keywords = text_and_keywords or self.get_abstract_text_and_keywords(article)
+        abstract_text += "\n".join(keywords)  # Each abstract text paragraph already ends with a newline
+        return abstract_text.translate(_CLEAN_TABLE).split()
 
-        return species
+    def filter_names_by_rank(self, names, ncbi, rank):
+        '''
+        Looks up a collection of names in the NCBI Taxonomy and returns the set of names that
+        correspond to a taxon of the given rank. All names are resolved in a single query and
+        all ranks in a second one; the results of the most recent lookups are cached for the lifetime of the process.
+        Params:
+         - names: iterable of candidate names
+         - ncbi: NCBITaxa instance
+         - rank: string. The taxonomic rank to keep (e.g., "species", "genus")
+        '''
+        names = set(names)
+        # The NCBI Taxonomy matches names case-insensitively and returns only one of several spellings of a name,
+        # so names are looked up and cached by their lowercase form and the result is mapped back to every spelling.
+        # Only names (and taxids) not seen before are sent to the NCBI Taxonomy database; the results of the
+        # current call are collected locally, since the caches may evict entries while they are filled
+        taxid_lists_lower = {}
+        unknown_names = {}
+        for name in names:
+            name_lower = name.lower()
+            if name_lower in _TAXID_CACHE:
+                taxid_lists_lower[name_lower] = _TAXID_CACHE[name_lower]
+            else:
+                unknown_names.setdefault(name_lower, name)
+        if unknown_names:
+            ncbi_results = {name.lower(): taxid_list for name, taxid_list in ncbi.get_name_translator(list(unknown_names.values())).items()}
+            for name_lower in unknown_names:
+                taxid_lists_lower[name_lower] = _TAXID_CACHE[name_lower] = ncbi_results.get(name_lower, [])
+        taxid_lists = {name: taxid_lists_lower[name.lower()] for name in names}
+        # Only the first taxid of each name is evaluated
+        taxids = {name: taxid_list[0] for name, taxid_list in taxid_lists.items() if taxid_list}
+        ranks = {}
+        unknown_taxids = []
+        for taxid in set(taxids.values()):
+            if taxid in _RANK_CACHE:
+                ranks[taxid] = _RANK_CACHE[taxid]
+            else:
+                unknown_taxids.append(taxid)
+        if unknown_taxids:
+            for taxid, taxid_rank in ncbi.get_rank(unknown_taxids).items():
+                ranks[taxid] = _RANK_CACHE[taxid] = taxid_rank
+        return set(name for name, taxid in taxids.items() if ranks.get(taxid) == rank)
 
-    def get_genera_from_pubmed_article(self, article, ncbi):
+    def get_species_from_pubmed_article(self, article, ncbi, text_and_keywords = None):
         '''
-        Parses a pubmed article for genus names
+        Parses a pubmed article for species names. If both species and genus names are of interest,
+        parse the article once via get_abstract_text_and_keywords and pass the result as text_and_keywords.
         '''
-        genera = set()
-        abstract_text = self.get_abstract_text(article)
-        keywords = self.get_article_keywords(article)
-        for keyword in keywords:
-            abstract_text += keyword + "\n"
-        regexp = r'[^a-zA-Z0-9.\-:\s]'
-        words = re.sub(regexp, '', abstract_text).split()
-        ncbi_results = ncbi.get_name_translator(words)
-        for name, id in ncbi_results.items():
-            if ncbi.get_rank(id)[id[0]] == "genus":
-                genera.add(name)
+        # We're only interested in species-rank taxons
+        return self.filter_names_by_rank(self.get_species_candidates(article, text_and_keywords), ncbi, "species")
 
-        return genera
+    def get_genera_from_pubmed_article(self, article, ncbi, text_and_keywords = None):
+        '''
+        Parses a pubmed article for genus names. If both species and genus names are of interest,
+        parse the article once via get_abstract_text_and_keywords and pass the result as text_and_keywords.
+        '''
+        return self.filter_names_by_rank(self.get_genus_candidates(article, text_and_keywords), ncbi, "genus")
+
+    def get_genera_from_pubmed_articles(self, articles, ncbi):
+        '''
+        Parses a list of pubmed articles for genus names, querying the NCBI Taxonomy
+        only once for all articles; returns a dictionary of article/genus set pairs
+        '''
+        candidates = {article: set(self.get_genus_candidates(article)) for article in articles}
+        genera = self.filter_names_by_rank(set().union(*candidates.values()), ncbi, "genus")
+        return {article: names & genera for article, names in candidates.items()}
 
 
     def construct_species_query(self, text):
         '''
         Constructs a string for every two adjacent words in the text and returns them as a list.
+        Around taxonomic expressions (e.g., "sp.", "var.", "subsp."), strings of three to five words are constructed instead.
         '''
-        species_queries = []
-        taxonomic_expressions = ["sp.", "x", "var.", "subsp.", "f."]
-        regexp = r'[^a-zA-Z0-9.\-:\s]'
-        words = text.split()
-        for i in range(0,len(words)-2):
-            # Since not all species names are simply two words, we need to account for these cases.
-            # Below is an attempt to account for the cases that were detected by a brief look at existing names
-            # We're also removing all characters that cannot(should not?) occur in taxonomy (e.g. a species name might be in parentheses)
-            if words[i+1] in taxonomic_expressions:
+        # Removing all characters that cannot(should not?) occur in taxonomy (e.g. a species name might be in parentheses)
+        # once for the whole text, so that the candidate strings below can simply be joined
+        words = text.translate(_CLEAN_TABLE).split()
+        # Every two adjacent words, unless the second word is a taxonomic expression
+        species_queries = [" ".join(w) for w in zip(words, words[1:]) if w[1] not in _TAX_EXPR]
+        # Since not all species names are simply two words, we need to account for these cases.
+        # Below is an attempt to account for the cases that were detected by a brief look at existing names.
+        # Longer names are only constructed around the positions of taxonomic expressions, which are located in a single scan.
+        n_words = len(words)
+        for i in [i for i, word in enumerate(words) if word in _TAX_EXPR]:
+            if words[i] == "sp.":
                 # "sp." is preceded by one word and is usually followed by one word, but we also found a case with two following words
-                if words[i+1] == "sp.":
-                    if i < len(words)-3:
-                        species_queries.append(re.sub(regexp, '', words[i] + " " + words[i+1] + " " + words[i+2]))
-                        if i < len(words)-4:
-                            species_queries.append(re.sub(regexp, '', words[i] + " " + words[i+1] + " " + words[i+2] + " " + words[i+3]))
-                if words[i+1] == "var." or words[i+1] == "f.":
-                    # "var." and "f." are preceded by two words and followed by one word
-                    if i < len(words)-3 and i > 0:
-                        species_queries.append(re.sub(regexp, '', words[i-1] + " " + words[i] + " " + words[i+1] + " " + words[i+2]))
-                if words[i+1] == "subsp.":
-                    # "subsp." is preceded by two words and is usually followed by one word, but we also found a case with two following words
-                    if i < len(words)-3 and i > 0:
-                        species_queries.append(re.sub(regexp, '', words[i-1] + " " + words[i] + " " + words[i+1] + " " + words[i+2]))
-                        if i < len(words)-4:
-                            species_queries.append(re.sub(regexp, '', words[i-1] + " " + words[i] + " " + words[i+1] + " " + words[i+2] + " " + words[i+3]))
-                if words[+1] == "x":
-                    # "x" is preceded by two words and followed by two words
-                    if i < len(words)-4 and i > 0:
-                        species_queries.append(re.sub(regexp, '', words[i-1] + " " + words[i] + " " + words[i+1] + " " + words[i+2] + " " + words[i+3]))
-            else:
-                species_queries.append(re.sub(regexp, '', words[i] + " " + words[i+1]))
+                if i > 0 and i+1 < n_words:
+                    species_queries.append(" ".join(words[i-1:i+2]))
+                if i > 0 and i+2 < n_words:
+                    species_queries.append(" ".join(words[i-1:i+3]))
+            elif words[i] == "var." or words[i] == "f.":
+                # "var." and "f." are preceded by two words and followed by one word
+                if i > 1 and i+1 < n_words:
+                    species_queries.append(" ".join(words[i-2:i+2]))
+            elif words[i] == "subsp.":
+                # "subsp." is preceded by two words and is usually followed by one word, but we also found a case with two following words
+                if i > 1 and i+1 < n_words:
+                    species_queries.append(" ".join(words[i-2:i+2]))
+                if i > 1 and i+2 < n_words:
+                    species_queries.append(" ".join(words[i-2:i+3]))
+            elif words[i] == "x":
+                # "x" is preceded by two words and followed by two words
+                if i > 1 and i+2 < n_words:
+                    species_queries.append(" ".join(words[i-2:i+3]))
         return species_queries
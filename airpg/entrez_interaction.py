@@ -1,14 +1,137 @@
-import os, subprocess, logging, urllib.request
-import xml.etree.ElementTree as ET
+import os, re, time, shutil, logging, threading, http.client, urllib.request, urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from lxml import etree as ET  # libxml2-based parser; considerably faster than the standard library
+except ImportError:
+    import xml.etree.ElementTree as ET
 from airpg import parse_pubmed
 import entrezpy.conduit
-from ete3 import NCBITaxa
 from datetime import date
 
+EUTILS_HOST = "eutils.ncbi.nlm.nih.gov"
+EUTILS_PATH = "/entrez/eutils/"
+# Keywords in the comment field of RefSeq records that indicate the regular accession the RefSeq record is based on,
+# combined into a single pattern so that each comment is scanned only once
+REFSEQ_KEYWORDS = ["PROVISIONAL REFSEQ: This record has not yet been subject to final NCBI review",
+                   "The reference sequence is identical to",
+                   "REVIEWED REFSEQ: This record has been curated by NCBI staff.",
+                   "The reference sequence was derived from"]
+REFSEQ_KEYWORDS_RE = re.compile("|".join(map(re.escape, REFSEQ_KEYWORDS)))
+MONTH_MAP = {"JAN":"01", "FEB":"02", "MAR":"03", "APR":"04", "MAY":"05", "JUN":"06", "JUL":"07", "AUG":"08", "SEP":"09", "OCT":"10", "NOV":"11", "DEC":"12"}
+
+# One persistent HTTPS connection to the E-utilities per thread (and process), so that consecutive
+# requests do not each open a new TCP connection and TLS session
+_eutils_connections = threading.local()
+
+def _eutils_connection(renew = False):
+    '''
+    Returns the E-utilities connection of the current thread, opening a new one if necessary
+    '''
+    conn = getattr(_eutils_connections, "conn", None)
+    # A connection inherited from the parent of a forked process must not be shared with it
+    if conn is not None and (renew or _eutils_connections.pid != os.getpid()):
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = http.client.HTTPSConnection(EUTILS_HOST)
+        _eutils_connections.conn = conn
+        _eutils_connections.pid = os.getpid()
+    return conn
+
+class RequestThrottle:
+    '''
+    Spaces out requests of all threads of a process, so that no more than a given number of requests per second is sent;
+    with a shared slot, the requests of all processes that share the slot are spaced out together
+    '''
+
+    def __init__(self, shared_slot = None):
+        '''
+        Params:
+         - shared_slot: (optional) multiprocessing.Value("d") holding the time of the next free request slot
+                        of several processes
+        '''
+        self.shared_slot = shared_slot
+        self.lock = shared_slot.get_lock() if shared_slot is not None else threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self, requests_per_second):
+        '''
+        Blocks until the calling thread may send its next request
+        Params:
+         - requests_per_second: maximum number of requests per second
+        '''
+        with self.lock:
+            # time.monotonic() is based on the system-wide monotonic clock, so its values are comparable between processes
+            now = time.monotonic()
+            if self.shared_slot is not None:
+                slot = max(now, self.shared_slot.value)
+                self.shared_slot.value = slot + 1.0 / requests_per_second
+            else:
+                slot = max(now, self.next_slot)
+                self.next_slot = slot + 1.0 / requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+# NCBI permits 3 requests per second without and 10 requests per second with an API key
+_eutils_throttle = RequestThrottle()
+
+def share_request_throttle(shared_slot):
+    '''
+    Spaces out the requests of this process together with those of all other processes that call this function
+    with the same shared slot; to be called in the parent process and in every worker process (e.g., via the
+    initializer of a process pool)
+    Params:
+     - shared_slot: multiprocessing.Value("d") created by the parent process
+    '''
+    global _eutils_throttle
+    _eutils_throttle = RequestThrottle(shared_slot)
+
+def eutil_request(eutil, **params):
+    '''
+    Sends a request to an NCBI E-utility and returns the (file-like) HTTP response, which must be read
+    completely before the next request is sent from the same thread.
+    If no NCBI API key is given as parameter api_key, it is read from the environment variable NCBI_API_KEY, if set.
+    Params:
+     - eutil: name of the E-utility (e.g., "esearch", "efetch")
+     - params: parameters of the request
+    '''
+    params["tool"] = "airpg"
+    api_key = params.pop("api_key", None) or os.environ.get("NCBI_API_KEY")
+    if api_key:
+        params["api_key"] = api_key
+    _eutils_throttle.wait(10 if api_key else 3)
+    # Parameters are sent via POST, which also permits long lists of IDs
+    body = urllib.parse.urlencode(params)
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    conn = _eutils_connection()
+    try:
+        try:
+            conn.request("POST", EUTILS_PATH + eutil + ".fcgi", body, headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # The server may have closed the idle connection in the meantime, or a previous response was not read completely
+            conn = _eutils_connection(renew = True)
+            conn.request("POST", EUTILS_PATH + eutil + ".fcgi", body, headers)
+            response = conn.getresponse()
+    except Exception:
+        conn.close()
+        raise
+    if response.status != 200:
+        response.read()
+        raise Exception("Error in request to NCBI E-utility %s: HTTP status %s (%s)" % (eutil, str(response.status), response.reason))
+    return response
+
 class EntrezInteraction:
 
-    def __init__(self, logger = None):
+    def __init__(self, logger = None, api_key = None):
+        '''
+        Params:
+         - api_key: (optional) NCBI API key, which raises the permitted rate of requests from 3 to 10 per second;
+           if not given, it is read from the environment variable NCBI_API_KEY, if set
+        '''
         self.log = logger or logging.getLogger(__name__ + ".EntrezInteraction")
+        self.api_key = api_key or os.environ.get("NCBI_API_KEY")
 
     def retrieve_uids(self, query, min_date = None):
         '''
@@ -18,16 +141,22 @@ class EntrezInteraction:
          - min_date: date. the minimum data to start searching from.
         '''
         sort_category = "Date Released"
+        esearch_params = {"db": "nucleotide", "sort": sort_category, "term": query, "usehistory": "y", "retmax": 0}
         if min_date:
-            esearch_args = ['esearch', '-db', 'nucleotide', '-sort', sort_category, '-mindate', min_date.strftime("%Y/%m/%d"), '-maxdate', date.today().strftime("%Y/%m/%d"), '-query', query]
-        else:
-            esearch_args = ['esearch', '-db', 'nucleotide', '-sort', sort_category, '-query', query]
-        esearch = subprocess.Popen(esearch_args, stdout=subprocess.PIPE)
-        efetchargs = ["efetch", "-format", "uid"]
-        efetch = subprocess.Popen(efetchargs, stdin=esearch.stdout, stdout=subprocess.PIPE)
-        out, err = efetch.communicate()
+            esearch_params.update({"datetype": "pdat", "mindate": min_date.strftime("%Y/%m/%d"), "maxdate": date.today().strftime("%Y/%m/%d")})
+        with eutil_request("esearch", **esearch_params, api_key=self.api_key) as response:
+            search_result = ET.fromstring(response.read())
+        count = int(search_result.findtext("Count"))
+        webenv = search_result.findtext("WebEnv")
+        query_key = search_result.findtext("QueryKey")
+        uids = []
+        for retstart in range(0, count, 10000):
+            with eutil_request("efetch", db="nucleotide", WebEnv=webenv, query_key=query_key, rettype="uilist", retmode="text", retstart=retstart, retmax=10000, api_key=self.api_key) as response:
+                # The response is consumed line by line (one UID per line) rather than buffered as a whole
+                uids.extend(int(line) for line in response if line.strip())
+        uids.reverse()
 
-        return list(map(int, out.splitlines()))[::-1]
+        return uids
 
     def fetch_xml_entry(self, uid):
         '''
@@ -41,19 +170,72 @@ class EntrezInteraction:
         #esummaryargs = ["efetch", "-db", "nucleotide", "-format", "gb", "-mode", "xml", "-id", str(uid)]
         #esummary = subprocess.Popen(esummaryargs, stdout=subprocess.PIPE)
         #out, err = esummary.communicate()
-        efetchargs = ["efetch", "-db", "nucleotide", "-format", "gb", "-mode", "xml", "-id", str(uid)]
-        efetch = subprocess.Popen(efetchargs, stdout=subprocess.PIPE)
-        out, err = efetch.communicate()
-        return ET.fromstring(out)
+        with eutil_request("efetch", db="nucleotide", rettype="gb", retmode="xml", id=str(uid), api_key=self.api_key) as response:
+            return ET.fromstring(response.read())
+
+    def fetch_xml_entries(self, uids, batch_size = 200, workers = None):
+        '''
+        Fetches GenBank entries in GenBank XML format in batches of UIDs, with several batches
+        being fetched concurrently; yields a tuple of UID and GBSeq element per entry.
+        Batches that cannot be retrieved are logged and skipped.
+        Params:
+         - uids: list of UIDs of the GenBank entries
+         - batch_size: number of UIDs fetched per efetch call
+         - workers: number of concurrent efetch calls, which is also the number of batches held in memory at a time
+           (default: 10 with API key, otherwise 3); the rate of requests is limited by eutil_request
+        '''
+        workers = workers or (10 if self.api_key else 3)
+        uids = list(uids)
+        batches = (uids[i:i+batch_size] for i in range(0, len(uids), batch_size))
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            # At most `workers` batches are requested or held at a time; a batch is released once its entries have been yielded
+            pending = deque()
+            for batch in batches:
+                pending.append((batch, executor.submit(self.fetch_xml_entry, ",".join(map(str, batch)))))
+                if len(pending) >= workers:
+                    yield from self._gbseqs_of_batch(*pending.popleft())
+            while pending:
+                yield from self._gbseqs_of_batch(*pending.popleft())
+
+    def _gbseqs_of_batch(self, batch, future):
+        '''
+        Yields a tuple of UID and GBSeq element per entry of a batch fetched by fetch_xml_entries
+        Params:
+         - batch: list of UIDs of the batch
+         - future: future of the GBSet of the batch
+        '''
+        try:
+            gbseqs = list(future.result().iterfind("GBSeq"))
+        except Exception as err:
+            self.log.warning("Error retrieving XML GenBank entries for UIDs %s to %s: %s" % (str(batch[0]), str(batch[-1]), str(err)))
+            return
+        for position, gbseq in enumerate(gbseqs):
+            uid = self.get_uid_of_gbseq(gbseq)
+            # efetch returns the entries in the order requested
+            if uid is None and len(gbseqs) == len(batch):
+                uid = batch[position]
+            if uid is None:
+                self.log.warning("Could not determine UID of XML GenBank entry '%s'. Skipping this entry." % (gbseq.findtext("GBSeq_primary-accession")))
+                continue
+            yield uid, gbseq
+
+    def get_uid_of_gbseq(self, gbseq):
+        '''
+        Returns the UID (i.e., the GI number) listed among the sequence identifiers of a GBSeq element, or None
+        '''
+        for seqid in gbseq.iterfind("GBSeq_other-seqids/GBSeqid"):
+            if seqid.text and seqid.text.startswith("gi|"):
+                return int(seqid.text[3:])
+        return None
 
     def parse_xml_entry(self, entry):
         '''
         Parses a GenBank XML entry and returns a dictionary of field name/value pairs
         Params:
-         - entry: ElementTree. The XML entry
+         - entry: ElementTree. The XML entry (either a GBSet or a single GBSeq element)
         '''
         # Parse out the relevant info from XML-formatted record summary
-        uid_data = entry.find("GBSeq")
+        uid_data = entry if entry.tag == "GBSeq" else entry.find("GBSeq")
         fields = {}
         accession = uid_data.find("GBSeq_primary-accession").text
         fields["ACCESSION"] = accession
@@ -63,12 +245,11 @@ class EntrezInteraction:
         fields["TAXONOMY"] = uid_data.find("GBSeq_taxonomy").text
 
         # Parse and format the date that the record was first online
-        month_map = {"JAN":"01", "FEB":"02", "MAR":"03", "APR":"04", "MAY":"05", "JUN":"06", "JUL":"07", "AUG":"08", "SEP":"09", "OCT":"10", "NOV":"11", "DEC":"12"}
         create_date = uid_data.find("GBSeq_create-date").text.split('-')
-        fields["CREATE_DATE"] = create_date[2] + "-" + month_map[create_date[1]] + "-" + create_date[0]
+        fields["CREATE_DATE"] = create_date[2] + "-" + MONTH_MAP[create_date[1]] + "-" + create_date[0]
 
         # Parse all info related to the authors and the publication
-        references = uid_data.find("GBSeq_references").findall("GBReference")
+        references = uid_data.find("GBSeq_references").iterfind("GBReference")
         authstring = ""
         title = ""
         citation = ""
@@ -77,13 +258,10 @@ class EntrezInteraction:
         for ref in references:
             # Look for a reference that has authors (not all entries have a reference with authors)
             authors = ref.find("GBReference_authors")
-            if authors:
+            if authors is not None and len(authors) > 0:
                 title = ref.find("GBReference_title").text
                 citation = ref.find("GBReference_journal").text
-                authors = ref.find("GBReference_authors").findall("GBAuthor")
-                for author in authors:
-                    authstring = authstring + author.text + ","
-                authstring = authstring[:-2]
+                authstring = ",".join(author.text for author in authors.iterfind("GBAuthor"))
                 break
         fields["AUTHORS"] = authstring
         fields["TITLE"] = title
@@ -95,12 +273,7 @@ class EntrezInteraction:
         if accession[:3] == "NC_":
             comments = uid_data.find("GBSeq_comment").text
             for comment in comments.split(";"):
-                keyw1 = "PROVISIONAL REFSEQ: This record has not yet been subject to final NCBI review"
-                keyw2 = "The reference sequence is identical to"
-                keyw3 = "REVIEWED REFSEQ: This record has been curated by NCBI staff."
-                keyw4 = "The reference sequence was derived from"
-                keywords = [keyw1, keyw2, keyw3, keyw4]
-                if any(keyw in comment for keyw in keywords): 
+                if REFSEQ_KEYWORDS_RE.search(comment):
                     duplseq = comment.split(" ")[-1][:-1]
                     note = "The REFSEQ accession '%s' is identical to accession '%s'." % (accession, duplseq)
         fields["NOTE"] = note
@@ -111,32 +284,84 @@ class EntrezInteraction:
     def fetch_gb_entry(self, acc_id, outdir):
         '''
         Saves GenBank flatfile with accession number "acc_id" to
-        outdir and returns the path and filename of the file
+        outdir and returns the path and filename of the file.
+        If the flatfile has already been saved to outdir, it is not fetched again.
         Params:
          - acc_id: accession number of the GenBank entry
          - outdir: file path to output directory
         '''
-        self.log.debug("Fetching GenBank entry %s and saving to %s" % (str(acc_id), outdir))
         gbFile = os.path.join(outdir, str(acc_id) + ".gb")
-        with open(gbFile, "w") as outfile:
-            efetchargs = ["efetch", "-db", "nucleotide", "-format", "gb", "-id", str(acc_id)]
-            efetch = subprocess.Popen(efetchargs, stdout=outfile)
-            efetch.wait()
+        if os.path.isfile(gbFile) and os.path.getsize(gbFile) > 0:
+            self.log.debug("GenBank entry %s already saved in %s" % (str(acc_id), outdir))
+            return gbFile
+        self.log.debug("Fetching GenBank entry %s and saving to %s" % (str(acc_id), outdir))
+        # Download to a temporary file first, so that an interrupted download is never mistaken for a saved entry
+        with open(gbFile + ".part", "wb") as outfile:
+            with eutil_request("efetch", db="nucleotide", rettype="gb", retmode="text", id=str(acc_id), api_key=self.api_key) as response:
+                shutil.copyfileobj(response, outfile)
+        os.replace(gbFile + ".part", gbFile)
         if not os.path.isfile(gbFile):
             raise Exception("Error retrieving GenBank flatfile of accession " + str(acc_id))
         elif os.path.getsize(gbFile) == 0:
             raise Exception("Error retrieving GenBank flatfile of accession " + str(acc_id))
         return gbFile
 
-    def fetch_pubmed_articles(self, mail, query):
+    def fetch_gb_entries(self, acc_ids, outdir, batch_size = 200):
+        '''
+        Saves the GenBank flatfiles of several accession numbers to outdir, fetching them in
+        batches of accession numbers (i.e., one efetch call per batch instead of one per accession).
+        Returns a dictionary of accession number/file path pairs; accessions that could not be
+        retrieved are logged and missing from the dictionary.
+        Params:
+         - acc_ids: list of accession numbers of the GenBank entries
+         - outdir: file path to output directory
+         - batch_size: number of accession numbers fetched per efetch call
+        '''
+        acc_ids = [str(acc_id) for acc_id in acc_ids]
+        fp_entries = {}
+        for i in range(0, len(acc_ids), batch_size):
+            batch = acc_ids[i:i+batch_size]
+            requested = set(batch)
+            self.log.debug("Fetching GenBank entries %s to %s and saving to %s" % (batch[0], batch[-1], outdir))
+            try:
+                with eutil_request("efetch", db="nucleotide", rettype="gb", retmode="text", id=",".join(batch), api_key=self.api_key) as response:
+                    # The response contains the records one after another, each terminated by a line "//"
+                    lines = []
+                    acc_id = None
+                    for line in response:
+                        lines.append(line)
+                        if line.startswith(b"ACCESSION") and acc_id is None:
+                            acc_id = line.split()[1].decode()
+                        elif line.startswith(b"//"):
+                            if acc_id in requested:
+                                gbFile = os.path.join(outdir, acc_id + ".gb")
+                                with open(gbFile + ".part", "wb") as outfile:
+                                    outfile.writelines(lines)
+                                os.replace(gbFile + ".part", gbFile)
+                                fp_entries[acc_id] = gbFile
+                            lines = []
+                            acc_id = None
+            except Exception as err:
+                self.log.warning("Error retrieving GenBank flatfiles of accessions %s to %s: %s" % (batch[0], batch[-1], str(err)))
+            for acc_id in batch:
+                if acc_id not in fp_entries:
+                    self.log.warning("GenBank flatfile of accession %s was not retrieved." % (acc_id))
+        return fp_entries
+
+    def fetch_pubmed_articles(self, mail, query, threads = None):
         '''
-        Fetches all articles from PubMed found by query and returns them as a list of PubMedRecord objects
+        Fetches all articles from PubMed found by query and returns them as a list of PubMedRecord objects.
+        If an NCBI API key is set, entrezpy permits 10 instead of 3 requests per second.
         Params:
          - mail: Mail address of requester
          - query: Entrez search string
+         - threads: (optional) number of threads with which entrezpy fetches the articles concurrently;
+                    by default 3 if an NCBI API key is set and 1 otherwise
         '''
+        if threads is None:
+            threads = 3 if self.api_key else 1
         articles = None
-        cond = entrezpy.conduit.Conduit(mail)
+        cond = entrezpy.conduit.Conduit(mail, apikey = self.api_key, threads = threads)
         fetch_pipe = cond.new_pipeline()
         sid = fetch_pipe.add_search({'db': 'pubmed', 'term': query, 'rettype': 'count'})
         fid = fetch_pipe.add_fetch({'retmode':'xml'}, dependency=sid, analyzer=parse_pubmed.PubMedAnalyzer())
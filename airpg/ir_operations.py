@@ -1,7 +1,42 @@
-import os, logging
+import os, re, logging
 from Bio import SeqIO
 from Bio.SeqRecord import SeqRecord
-from Bio.SeqFeature import SeqFeature, FeatureLocation
+from Bio.Seq import Seq
+from Bio.SeqFeature import SeqFeature, FeatureLocation, Location
+
+# Identifiers of the junctions between the inverted repeats and the single copy regions, each mapped to
+# the junction types it indicates (0: JLB, 1: JSB, 2: JSA, 3: JLA) and whether it is a hard identifier
+JUNCTION_IDENTIFIERS = {
+	"jlb": ((0,), True), "lsc-irb": ((0,), True), "irb-lsc": ((0,), True),
+	"jsb": ((1,), True), "ssc-irb": ((1,), True), "irb-ssc": ((1,), True),
+	"jsa": ((2,), True), "ssc-ira": ((2,), True), "ira-ssc": ((2,), True),
+	"jla": ((3,), True), "ira-lsc": ((3,), True), "lsc-ira": ((3,), True),
+	"lsc-ir": ((0, 3), False), "ir-lsc": ((0, 3), False),
+	"ssc-ir": ((1, 2), False), "ir-ssc": ((1, 2), False)
+}
+# A single pattern that finds all (also overlapping) junction identifiers in one scan;
+# longer identifiers come first so that a hard identifier is preferred over a soft identifier it contains
+JUNCTION_RE = re.compile("(?=(%s))" % "|".join(map(re.escape, sorted(JUNCTION_IDENTIFIERS, key=len, reverse=True))))
+
+# Identifiers of the individual inverted repeats and single copy regions, and identifiers of junctions
+# that exclude a feature from being an IR or a single copy region
+IRA_IDENTIFIERS_RE = re.compile("ira|inverted repeat a")
+IRB_IDENTIFIERS_RE = re.compile("irb|inverted repeat b")
+SSC_IDENTIFIERS_RE = re.compile("ssc|small single copy")
+LSC_IDENTIFIERS_RE = re.compile("lsc|large single copy")
+JUNCTION_BLOCKLIST_RE = re.compile("jlb|jsb|jsa|jla|junction")
+
+# Translation table that complements nucleotides (including IUPAC ambiguity codes) in both upper and lower case
+_COMPLEMENT_TABLE = str.maketrans("ACGTRYKMBVDHSWNacgtrykmbvdhswn", "TGCAYRMKVBHDSWNtgcayrmkvbhdswn")
+
+def reverse_complement(seq):
+	'''
+	Returns the reverse complement of a nucleotide sequence given as string
+	'''
+	return seq[::-1].translate(_COMPLEMENT_TABLE)
+
+# Types of the features with which the IRs and single copy regions are marked
+IR_FEATURE_TYPES = frozenset(("repeat_region", "misc_feature"))
 
 class IROperations:
 
@@ -12,14 +47,23 @@ class IROperations:
 	# I/O methods #
 	###############
 
-	def read_record(self, fp_record):
+	def read_record(self, fp_record, ir_features_only = False):
 		'''
 		Reads a GenBank flat file and returns it as SeqRecord
+		Params:
+		 - fp_record: file path to the GenBank flat file
+		 - ir_features_only: Boolean. Indicates whether only the ID, the sequence and the features
+		   needed to identify the IRs are read (see parse_ir_features), which is considerably faster
 		'''
 		rec = None
 		if os.path.isfile(fp_record):
 			accession = os.path.splitext(fp_record)[0]
 			try:
+				if ir_features_only:
+					try:
+						return self.parse_ir_features(fp_record)
+					except Exception as err:
+						self.log.debug("Parsing only the IR features of `%s` failed (%s); parsing the complete record instead.", fp_record, err)
 				rec = SeqIO.read(fp_record, "genbank")
 			except Exception as err:
 				raise Exception("Error reading record of accession `%s`: %s. Skipping this accession." % (str(accession), str(err)))
@@ -27,6 +71,75 @@ class IROperations:
 			raise Exception("Error reading record: Unable to find '%s'." % (fp_record))
 		return rec
 
+	def parse_ir_features(self, fp_record):
+		'''
+		Parses a GenBank flat file for only the information needed to identify the IRs, i.e. the ID,
+		the sequence and the features of the types in IR_FEATURE_TYPES, and returns it as SeqRecord.
+		All other features are skipped without being parsed.
+		'''
+		rec_id = None
+		name = None
+		rec_len = None
+		circular = False
+		features = []  # Tuples of feature type, location lines and qualifier lines
+		feature = None
+		seq_lines = []
+		section = None
+		with open(fp_record, "r") as fh_record:
+			for line in fh_record:
+				if section == "ORIGIN":
+					if line.startswith("//"):
+						break
+					seq_lines.append("".join(line.split()[1:]))
+				elif line[:1] == " ":
+					if section != "FEATURES":
+						continue
+					if line[5] != " ":
+						# First line of a feature
+						feature_type = line[5:21].strip()
+						feature = (feature_type, [line[21:].strip()], []) if feature_type in IR_FEATURE_TYPES else None
+						if feature:
+							features.append(feature)
+					elif feature:
+						text = line[21:].strip()
+						if text.startswith("/"):
+							feature[2].append(text)
+						elif feature[2]:
+							feature[2][-1] += " " + text  # Qualifier values spanning several lines are joined with spaces
+						else:
+							feature[1].append(text)
+				elif line.startswith("LOCUS"):
+					locus = line.split()
+					name = locus[1]
+					rec_len = int(locus[2])
+					circular = "circular" in locus
+				elif line.startswith("VERSION"):
+					rec_id = line.split()[1]
+				elif line.startswith("FEATURES"):
+					section = "FEATURES"
+				elif line.startswith("ORIGIN"):
+					section = "ORIGIN"
+				elif line.startswith("//"):
+					break
+				else:
+					section = None
+		if rec_id is None or not seq_lines:
+			raise Exception("Record does not contain an ID or a sequence.")
+
+		rec = SeqRecord(Seq("".join(seq_lines).upper()), id = rec_id, name = name)
+		if len(rec) != rec_len:
+			raise Exception("Length of the sequence differs from the length given in the LOCUS line.")
+		for feature_type, location_lines, qualifier_lines in features:
+			qualifiers = {}
+			for qualifier in qualifier_lines:
+				key, _, value = qualifier[1:].partition("=")
+				if value.startswith('"') and value.endswith('"'):
+					value = value[1:-1].replace('""', '"')
+				qualifiers.setdefault(key, []).append(value)
+			location = Location.fromstring("".join(location_lines), length = rec_len, circular = circular)
+			rec.features.append(SeqFeature(location, type = feature_type, qualifiers = qualifiers))
+		return rec
+
 	def write_sequence_to_fasta(self, seq, header, fp_outfile):
 		'''
 		Writes a sequence to a new file in FASTA format
@@ -38,9 +151,8 @@ class IROperations:
 		if not seq is None:
 			if not header.startswith(">"):
 				header = ">" + header
-			with open(fp_outfile, "w") as fh_outfile:
-				fh_outfile.write(header + "\n")
-				fh_outfile.write(seq + "\n")
+			with open(fp_outfile, "wb") as fh_outfile:
+				fh_outfile.write(b"".join((header.encode(), b"\n", seq.encode(), b"\n")))
 
 	def write_irs_to_fasta(self, rec, IRa, IRb, fp_outdir, rev_comp = False):
 		'''
@@ -53,28 +165,14 @@ class IROperations:
 		 - rev_comp: Boolean. Indicates whether the reverse complement of IRb's sequence will be written instead of as provided
 		'''
 		accession = str(rec.id).split('.')[0]
-		if not (IRa is None or IRb is None):
+		if IRa is not None:
 			IRa_seq = str(IRa.extract(rec).seq)
-			IRa_header = str(accession) + "_IRa"
-			IRb_header = str(accession) + "_IRb_revComp"
+			self.write_sequence_to_fasta(IRa_seq, accession + "_IRa", os.path.join(fp_outdir, accession + "_IRa.fasta"))
+		if IRb is not None:
+			IRb_seq = str(IRb.extract(rec).seq)
 			if rev_comp:
-				IRb_seq = str(IRb.extract(rec).seq.reverse_complement())
-			else:
-				IRb_seq = str(IRb.extract(rec).seq)
-
-			self.write_sequence_to_fasta(IRa_seq, IRa_header, os.path.join(fp_outdir, accession + "_IRa.fasta"))
-			self.write_sequence_to_fasta(IRb_seq, IRb_header, os.path.join(fp_outdir, accession + "_IRb_revComp.fasta"))
-		elif not IRa is None and IRb is None:
-			IRa_seq = str(IRa.extract(rec).seq)
-			IRa_header = str(accession) + "_IRa"
-			self.write_sequence_to_fasta(IRa_seq, IRa_header, os.path.join(fp_outdir, accession + "_IRa.fasta"))
-		elif IRa is None and not IRb is None:
-			IRb_header = str(accession) + "_IRb_revComp"
-			if rev_comp:
-				IRb_seq = str(IRb.extract(rec).seq.reverse_complement())
-			else:
-				IRb_seq = str(IRb.extract(rec).seq)
-			self.write_sequence_to_fasta(IRb_seq, IRb_header, os.path.join(fp_outdir, accession + "_IRb_revComp.fasta"))
+				IRb_seq = reverse_complement(IRb_seq)
+			self.write_sequence_to_fasta(IRb_seq, accession + "_IRb_revComp", os.path.join(fp_outdir, accession + "_IRb_revComp.fasta"))
 
 	##################################
 	# feature identification methods #
@@ -100,41 +198,24 @@ class IROperations:
 
 		if len(feature) < 3:
 			identified = False
-			possible_junctions = []
-
-			jlb_identifiers = {"hard": ["jlb", "lsc-irb", "irb-lsc"], "soft": ["lsc-ir", "ir-lsc"]}
-			jsb_identifiers = {"hard": ["jsb", "ssc-irb", "irb-ssc"], "soft": ["ssc-ir", "ir-ssc"]}
-			jsa_identifiers = {"hard": ["jsa", "ssc-ira", "ira-ssc"], "soft": ["ssc-ir", "ir-ssc"]}
-			jla_identifiers = {"hard": ["jla", "ira-lsc", "lsc-ira"], "soft": ["lsc-ir", "ir-lsc"]}
 
 			# TODO: implement a check that looks at feature.qualifiers["standard_name"] for values ["jlb", "jsb", "jsa", "jla"]
 
-			if any(identifier in feature.qualifiers["note"][0].lower() for identifier in jlb_identifiers["hard"]):
-				junction_type = 0
-				identified = True
-			elif any(identifier in feature.qualifiers["note"][0].lower() for identifier in jlb_identifiers["soft"]):
-				possible_junctions.append(0)
-
-			if not identified:
-				if any(identifier in feature.qualifiers["note"][0].lower() for identifier in jsb_identifiers["hard"]):
-					junction_type = 1
-					identified = True
-				elif any(identifier in feature.qualifiers["note"][0].lower() for identifier in jsb_identifiers["soft"]):
-					possible_junctions.append(1)
-
-			if not identified:
-				if any(identifier in feature.qualifiers["note"][0].lower() for identifier in jsa_identifiers["hard"]):
-					junction_type = 2
-					identified = True
-				elif any(identifier in feature.qualifiers["note"][0].lower() for identifier in jsa_identifiers["soft"]):
-					possible_junctions.append(2)
+			hard_junctions = set()
+			soft_junctions = set()
+			for match in JUNCTION_RE.finditer(feature.qualifiers["note"][0].lower()):
+				junction_types, is_hard = JUNCTION_IDENTIFIERS[match.group(1)]
+				if is_hard:
+					hard_junctions.update(junction_types)
+				else:
+					soft_junctions.update(junction_types)
 
-			if not identified:
-				if any(identifier in feature.qualifiers["note"][0].lower() for identifier in jla_identifiers["hard"]):
-					junction_type = 3
-					identified = True
-				elif any(identifier in feature.qualifiers["note"][0].lower() for identifier in jla_identifiers["soft"]):
-					possible_junctions.append(3)
+			# Hard identifiers are evaluated in the order JLB, JSB, JSA, JLA
+			if hard_junctions:
+				junction_type = min(hard_junctions)
+				identified = True
+			else:
+				possible_junctions = sorted(soft_junctions)
 
 			if not identified:
 				if len(possible_junctions) == 1:
@@ -144,7 +225,7 @@ class IROperations:
 					# if the feature is located at the end of the sequence, it is most certainly a JLA
 					# NOTE: found exceptions to this rule -> TODO: account for those exceptions
 					if 3 in possible_junctions:
-						if feature.location.start in range(rec_len - 10, rec_len):
+						if rec_len - 10 <= feature.location.start < rec_len:
 							identified = True
 							junction_type = 3
 						else:
@@ -173,54 +254,72 @@ class IROperations:
 		jsa_feat = None
 		jla_feat = None
 
+		# The features are checked from last to first and only the first hit per junction type is kept, so that the
+		# last feature of each junction type is used (as if all features were checked in order), while the search can
+		# stop as soon as all four junctions are found
 		i = 0
-		for misc_feature in [mf for mf in all_misc_features if "note" in mf.qualifiers]:
+		for misc_feature in reversed([mf for mf in all_misc_features if "note" in mf.qualifiers]):
 			i += 1
-			self.log.debug("Checking misc_feature %s out of %s (position %s - %s)..." % \
-			  (str(i), str(len(all_misc_features)), str(misc_feature.location.start), str(misc_feature.location.end)))
+			self.log.debug("Checking misc_feature %s out of %s (position %s - %s)...",
+			  i, len(all_misc_features), misc_feature.location.start, misc_feature.location.end)
 			junction_type = self.identify_junction(misc_feature, rec_len)
 			if junction_type == 0: # JLB
 				self.log.debug("Found junction LSC-IRb.")
-				jlb_feat = misc_feature
+				if jlb_feat is None:
+					jlb_feat = misc_feature
 			elif junction_type == 1: # JSB
 				self.log.debug("Found junction IRb-SSC.")
-				jsb_feat = misc_feature
+				if jsb_feat is None:
+					jsb_feat = misc_feature
 			elif junction_type == 2: # JSA
 				self.log.debug("Found junction SSC-IRa.")
-				jsa_feat = misc_feature
+				if jsa_feat is None:
+					jsa_feat = misc_feature
 			elif junction_type == 3: # JLA
 				self.log.debug("Found junction IRa-LSC")
-				jla_feat = misc_feature
+				if jla_feat is None:
+					jla_feat = misc_feature
 			elif junction_type == 4: # Ambiguous
 				self.log.debug("Found a junction but its identifiers are ambiguous.")
-
-		for junction in [jlb_feat, jsb_feat, jsa_feat, jla_feat]:
-			junction = self.adjust_feature_location(junction)
-		if jlb_feat and jsb_feat:
+			if jlb_feat is not None and jsb_feat is not None and jsa_feat is not None and jla_feat is not None:
+				self.log.debug("Found all four junctions.")
+				break
+
+		jlb_feat = self.adjust_feature_location(jlb_feat)
+		jsb_feat = self.adjust_feature_location(jsb_feat)
+		jsa_feat = self.adjust_feature_location(jsa_feat)
+		jla_feat = self.adjust_feature_location(jla_feat)
+		# The feature locations are looked up once and kept as locals
+		jlb_loc = jlb_feat.location if jlb_feat is not None else None
+		jsb_loc = jsb_feat.location if jsb_feat is not None else None
+		jsa_loc = jsa_feat.location if jsa_feat is not None else None
+		jla_loc = jla_feat.location if jla_feat is not None else None
+		# Zero-length locations are falsy, hence the explicit comparisons with None
+		if jlb_loc is not None and jsb_loc is not None:
 			self.log.debug("Constructing IRb from found junctions.")
-			if jlb_feat.location.start < jsb_feat.location.start:
-				IRb = SeqFeature(FeatureLocation(jlb_feat.location.end-1, jsb_feat.location.start+1, strand = 1))
+			if jlb_loc.start < jsb_loc.start:
+				IRb = SeqFeature(FeatureLocation(jlb_loc.end-1, jsb_loc.start+1, strand = 1))
 			else:
-				IRb = SeqFeature(FeatureLocation(jsb_feat.location.end-1, jlb_feat.location.start+1, strand = 1))
-		if jsa_feat:
+				IRb = SeqFeature(FeatureLocation(jsb_loc.end-1, jlb_loc.start+1, strand = 1))
+		if jsa_loc is not None:
 			self.log.debug("Constructing IRa from found junctions.")
-			if jla_feat:
+			if jla_loc is not None:
 				# comparing start locations to see in which order the IRs and SC regions are in the genome
-				if jsa_feat.location.start < jla_feat.location.start:
-					IRa = SeqFeature(FeatureLocation(jsa_feat.location.end-1, jla_feat.location.start+1, strand = 1))
+				if jsa_loc.start < jla_loc.start:
+					IRa = SeqFeature(FeatureLocation(jsa_loc.end-1, jla_loc.start+1, strand = 1))
 				else:
-					IRa = SeqFeature(FeatureLocation(jla_feat.location.end-1, jsa_feat.location.start+1, strand = 1))
-			elif jsb_feat:
+					IRa = SeqFeature(FeatureLocation(jla_loc.end-1, jsa_loc.start+1, strand = 1))
+			elif jsb_loc is not None:
 				# If JLA is not given, we assume that the plastid genome is split at the JLA
 				# (i.e. start of the JLA is the last position in the sequence, end of the JLA is the first position)
-				if jsb_feat.location.start < jsa_feat.location.start:
-					IRa = SeqFeature(FeatureLocation(jsa_feat.location.end-1, rec_len, strand = 1))
+				if jsb_loc.start < jsa_loc.start:
+					IRa = SeqFeature(FeatureLocation(jsa_loc.end-1, rec_len, strand = 1))
 				else:
-					IRa = SeqFeature(FeatureLocation(0, jsa_feat.location.start+1, strand = 1))
+					IRa = SeqFeature(FeatureLocation(0, jsa_loc.start+1, strand = 1))
 			else:
 				# if JSB is not given either, we assume the plastid genome follows the
 				# convention of (start:LSC|IRb|SSC|IRa:end)
-				IRa = SeqFeature(FeatureLocation(jsa_feat.location.end-1, rec_len, strand = 1))
+				IRa = SeqFeature(FeatureLocation(jsa_loc.end-1, rec_len, strand = 1))
 		return IRa, IRb
 
 	def infer_irs_from_single_copy_regions(self, rec_len, all_mf_no_pseudo, IRa = None, IRb = None):
@@ -235,49 +334,42 @@ class IROperations:
 		'''
 		ssc = None
 		lsc = None
-		ssc_identifiers = ["ssc", "small single copy"]
-		lsc_identifiers = ["lsc", "large single copy"]
-		blocklist = ["jlb", "jsb", "jsa", "jla", "junction"]
 		i = 0
 		for misc_feature in [mf for mf in all_mf_no_pseudo if "note" in mf.qualifiers]:
 			i += 1
-			self.log.debug("Checking misc_feature %s out of %s (position %s - %s)..." % \
-			  (str(i), str(len(all_mf_no_pseudo)), str(misc_feature.location.start), str(misc_feature.location.end)))
-			if any(identifier in misc_feature.qualifiers["note"][0].lower() for identifier in ssc_identifiers) and \
-			   not any(blocked in misc_feature.qualifiers["note"][0].lower() for blocked in blocklist):
+			self.log.debug("Checking misc_feature %s out of %s (position %s - %s)...",
+			  i, len(all_mf_no_pseudo), misc_feature.location.start, misc_feature.location.end)
+			note = misc_feature.qualifiers["note"][0].lower()
+			if SSC_IDENTIFIERS_RE.search(note) and not JUNCTION_BLOCKLIST_RE.search(note):
 				self.log.debug("Found identifier for SSC")
 				ssc = misc_feature
-			if any(identifier in misc_feature.qualifiers["note"][0].lower() for identifier in lsc_identifiers) and \
-			   not any(blocked in misc_feature.qualifiers["note"][0].lower() for blocked in blocklist):
+			if LSC_IDENTIFIERS_RE.search(note) and not JUNCTION_BLOCKLIST_RE.search(note):
 				self.log.debug("Found identifier for LSC")
 				lsc = misc_feature
 		if lsc and ssc:
-			if lsc.location.start < ssc.location.start:
-				ira_start = ssc.location.end - 1
-				ira_end = lsc.location.start
-				irb_start = lsc.location.end - 1
-				irb_end = ssc.location.start
-				if ira_end == 0:
-					ira_end = rec_len
-				if IRa is None:
-					self.log.debug("Constructing IRa from found single-copy positions.")
-					IRa = SeqFeature(FeatureLocation(ira_start, ira_end), type="misc_feature", strand=1)
-				if IRb is None:
-					self.log.debug("Constructing IRb from found single-copy positions.")
-					IRb = SeqFeature(FeatureLocation(irb_start, irb_end), type="misc_feature", strand=1)
+			lsc_loc = lsc.location
+			ssc_loc = ssc.location
+			if lsc_loc.start < ssc_loc.start:
+				ira_start = ssc_loc.end - 1
+				ira_end = lsc_loc.start
+				irb_start = lsc_loc.end - 1
+				irb_end = ssc_loc.start
 			else:
-				ira_start = lsc.location.end - 1
-				ira_end = ssc.location.start
-				irb_start = ssc.location.end - 1
-				irb_end = lsc.location.start
-				if irb_end == 0:
-					irb_end = rec_len
-				if IRa is None:
-					self.log.debug("Constructing IRa from found single-copy positions.")
-					IRa = SeqFeature(FeatureLocation(lsc.location.end-1, ssc.location.start), type="misc_feature", strand=1)
-				if IRb is None:
-					self.log.debug("Constructing IRb from found single-copy positions.")
-					IRb = SeqFeature(FeatureLocation(ssc.location.end-1, lsc.location.start), type="misc_feature", strand=1)
+				ira_start = lsc_loc.end - 1
+				ira_end = ssc_loc.start
+				irb_start = ssc_loc.end - 1
+				irb_end = lsc_loc.start
+			# An IR that ends where the sequence starts (i.e., the LSC starts at position 0) ends at the end of the sequence
+			if ira_end == 0:
+				ira_end = rec_len
+			if irb_end == 0:
+				irb_end = rec_len
+			if IRa is None:
+				self.log.debug("Constructing IRa from found single-copy positions.")
+				IRa = SeqFeature(FeatureLocation(ira_start, ira_end), type="misc_feature", strand=1)
+			if IRb is None:
+				self.log.debug("Constructing IRb from found single-copy positions.")
+				IRb = SeqFeature(FeatureLocation(irb_start, irb_end), type="misc_feature", strand=1)
 		return IRa, IRb
 
 	def identify_irs_in_misc_features(self, all_mf_no_pseudo, IRa = None, IRb = None):
@@ -288,44 +380,44 @@ class IROperations:
 		 - IRa: SeqFeature that corresponds to Inverted Repeat A
 		 - IRb: SeqFeature that corresponds to Inverted Repeat B
 		'''
-		ira_identifiers = ["ira", "inverted repeat a"]
-		irb_identifiers = ["irb", "inverted repeat b"]
-		blocklist = ["jlb", "jsb", "jsa", "jla", "junction"]
-		# STEP 1: Check for hard identifiers
+		# Features with a general identifier for IRs; these are only evaluated (in STEP 2) if
+		# the hard identifiers do not yield both IRs
+		general_ir_features = []
+		# STEP 1: Check for hard identifiers (single pass over all features)
 		for misc_feature in [mf for mf in all_mf_no_pseudo if "note" in mf.qualifiers]:
+			note = misc_feature.qualifiers["note"][0].lower()
+			if JUNCTION_BLOCKLIST_RE.search(note):
+				continue
+			feature_len = len(misc_feature)
 			if IRa is None:
-				if any(identifier in misc_feature.qualifiers["note"][0].lower() for identifier in ira_identifiers) and \
-				  not any(blocked in misc_feature.qualifiers["note"][0].lower() for blocked in blocklist):
-					self.log.debug("Found identifier for IRa: `%s`" % str(misc_feature.qualifiers["note"][0]))
-					if len(misc_feature) > 100:
+				if IRA_IDENTIFIERS_RE.search(note):
+					self.log.debug("Found identifier for IRa: `%s`", misc_feature.qualifiers["note"][0])
+					if feature_len > 100:
 						IRa = misc_feature
 					else:
-						self.log.debug("Feature is too short (%s bp) to be an IR." % str(len(misc_feature)))
+						self.log.debug("Feature is too short (%s bp) to be an IR.", feature_len)
 			if IRb is None:
-				if any(identifier in misc_feature.qualifiers["note"][0].lower() for identifier in irb_identifiers) and \
-				  not any(blocked in misc_feature.qualifiers["note"][0].lower() for blocked in blocklist):
-					self.log.debug("Found identifier for IRb: `%s`" % str(misc_feature.qualifiers["note"][0]))
-					if len(misc_feature) > 100:
+				if IRB_IDENTIFIERS_RE.search(note):
+					self.log.debug("Found identifier for IRb: `%s`", misc_feature.qualifiers["note"][0])
+					if feature_len > 100:
 						IRb = misc_feature
 					else:
-						self.log.debug("Feature is too short (%s bp) to be an IR." % str(len(misc_feature)))
+						self.log.debug("Feature is too short (%s bp) to be an IR.", feature_len)
+			if ("inverted" in note and "repeat" in note) or "IR" in misc_feature.qualifiers["note"][0]:
+				general_ir_features.append((misc_feature, feature_len))
 		# STEP 2: Check for soft identifiers
 		if IRa is None or IRb is None:
-			for misc_feature in [mf for mf in all_mf_no_pseudo if "note" in mf.qualifiers]:
-				if (("inverted" in misc_feature.qualifiers["note"][0].lower() and \
-				  "repeat" in misc_feature.qualifiers["note"][0].lower()) or \
-				  "IR" in misc_feature.qualifiers["note"][0]) and \
-				  not any(blocked in misc_feature.qualifiers["note"][0].lower() for blocked in blocklist):
-					self.log.debug("Found general identifier for IRs: `%s`" % str(misc_feature.qualifiers["note"][0]))
-					if len(misc_feature) > 100:
-						if IRb is None:
-							self.log.debug("Assign feature as IRb")
-							IRb = misc_feature
-						elif IRa is None:
-							self.log.debug("Assign feature as IRa")
-							IRa = misc_feature
-					else:
-						self.log.debug("Feature is too short (%s bp) to be an IR." % str(len(misc_feature)))
+			for misc_feature, feature_len in general_ir_features:
+				self.log.debug("Found general identifier for IRs: `%s`", misc_feature.qualifiers["note"][0])
+				if feature_len > 100:
+					if IRb is None:
+						self.log.debug("Assign feature as IRb")
+						IRb = misc_feature
+					elif IRa is None:
+						self.log.debug("Assign feature as IRa")
+						IRa = misc_feature
+				else:
+					self.log.debug("Feature is too short (%s bp) to be an IR.", feature_len)
 		return IRa, IRb
 
 	def identify_irs_in_repeat_features(self, all_repeat_features, IRa = None, IRb = None, min_IR_len = 1000):
@@ -337,26 +429,25 @@ class IROperations:
 		 - IRb: SeqFeature that corresponds to Inverted Repeat B
 		 - min_IR_len: minimum length identified IRs must have.
 		'''
-		ira_identifiers = ["ira", "inverted repeat a"]
-		irb_identifiers = ["irb", "inverted repeat b"]
 		# Loop through repeat_regions and attempt to identify IRs
 		self.log.debug("Checking all repeat_features with 'rpt_type' qualifier for IR information...")
 		i = 0
 		for repeat_feature in [rf for rf in all_repeat_features if "rpt_type" in rf.qualifiers]:
 			i += 1
-			self.log.debug("Checking repeat_feature %s out of %s (position %s - %s)..." % \
-			  (str(i), str(len(all_repeat_features)), str(repeat_feature.location.start), str(repeat_feature.location.end)))
+			self.log.debug("Checking repeat_feature %s out of %s (position %s - %s)...",
+			  i, len(all_repeat_features), repeat_feature.location.start, repeat_feature.location.end)
 			if repeat_feature.qualifiers["rpt_type"][0].lower() == "inverted":
 				self.log.debug("Feature is of rpt_type=inverted")
 				if len(repeat_feature) > min_IR_len:
 					if "note" in repeat_feature.qualifiers:
 						self.log.debug("Checking note qualifier for IR identifiers.")
+						note = repeat_feature.qualifiers["note"][0].lower()
 						# If the "note" qualifier contains explicit mention of which IR (a/b) we are looking at, assign
 						# it to the appropriate variable.
-						if any(identifier in repeat_feature.qualifiers["note"][0].lower() for identifier in ira_identifiers):
+						if IRA_IDENTIFIERS_RE.search(note):
 							self.log.debug("Found identifier for IRa.")
 							IRa = repeat_feature
-						elif any(identifier in repeat_feature.qualifiers["note"][0].lower() for identifier in irb_identifiers):
+						elif IRB_IDENTIFIERS_RE.search(note):
 							self.log.debug("Found identifier for IRb.")
 							IRb = repeat_feature
 						# If the "note" qualifier holds no information on which IR we are looking at, assign
@@ -384,22 +475,23 @@ class IROperations:
 					self.log.info("Inverted repeat feature detected at position %s - %s. Region is too small (smaller than %s bp) to be IRa or IRb." % \
 					  (str(repeat_feature.location.start), str(repeat_feature.location.end), str(min_IR_len)))
 		if IRa is None or IRb is None:
-			self.log.debug("%s out of 2 IR positions found so far. Checking repeat_features without 'rpt_type' qualifier." % \
-			  (str([IRa is None, IRb is None].count(False))))
+			self.log.debug("%s out of 2 IR positions found so far. Checking repeat_features without 'rpt_type' qualifier.",
+			  [IRa is None, IRb is None].count(False))
 			i = 0
 			for repeat_feature in [feature for feature in all_repeat_features if not "rpt_type" in feature.qualifiers]:
 				i += 1
-				self.log.debug("Checking repeat_feature %s out of %s (position %s - %s)..." % \
-				  (str(i), str(len(all_repeat_features)), str(repeat_feature.location.start), str(repeat_feature.location.end)))
+				self.log.debug("Checking repeat_feature %s out of %s (position %s - %s)...",
+				  i, len(all_repeat_features), repeat_feature.location.start, repeat_feature.location.end)
 				if "note" in repeat_feature.qualifiers:
 					self.log.debug("Checking note qualifier for IR identifiers...")
-					if any(identifier in repeat_feature.qualifiers["note"][0].lower() for identifier in ira_identifiers):
+					note = repeat_feature.qualifiers["note"][0].lower()
+					if IRA_IDENTIFIERS_RE.search(note):
 						self.log.debug("Found identifier for IRa.")
 						IRa = repeat_feature
-					elif any(identifier in repeat_feature.qualifiers["note"][0].lower() for identifier in irb_identifiers):
+					elif IRB_IDENTIFIERS_RE.search(note):
 						self.log.debug("Found identifier for IRb.")
 						IRb = repeat_feature
-					elif ("inverted" in repeat_feature.qualifiers["note"][0].lower() and "repeat" in repeat_feature.qualifiers["note"][0].lower()) or "IR" in repeat_feature.qualifiers["note"][0]:
+					elif ("inverted" in note and "repeat" in note) or "IR" in repeat_feature.qualifiers["note"][0]:
 						self.log.debug("Found general identifier for IRs.")
 						# IRb gets assigned first, since it is located before IRa in the sequence, so if there
 						# is no further information given, the first IR found is assumed to be IRb.
@@ -430,12 +522,19 @@ class IROperations:
 		IRb = None
 		self.log.debug("Trying to determine IRs...")
 
-		# STEP 1. Parse out all potentially relevant features
-		all_repeat_features = [feature for feature in rec.features if feature.type=='repeat_region']
-		all_misc_features = [feature for feature in rec.features if feature.type=='misc_feature']
-		# Note: The following line prevents that pseudogenes (or related pseudo-features)
-		#       are used to infer the IR length.
-		all_mf_no_pseudo = [feature for feature in all_misc_features if 'pseudo' not in feature.qualifiers]
+		# STEP 1. Parse out all potentially relevant features (in a single pass over all features)
+		all_repeat_features = []
+		all_misc_features = []
+		all_mf_no_pseudo = []
+		for feature in rec.features:
+			if feature.type == 'repeat_region':
+				all_repeat_features.append(feature)
+			elif feature.type == 'misc_feature':
+				all_misc_features.append(feature)
+				# Note: The following line prevents that pseudogenes (or related pseudo-features)
+				#       are used to infer the IR length.
+				if 'pseudo' not in feature.qualifiers:
+					all_mf_no_pseudo.append(feature)
 
 		if len(all_repeat_features) == 0 and len(all_misc_features) == 0:
 			raise Exception("Record does not contain any features which the IR are typically marked with (i.e., feature `repeat_region`, `misc_feature`).")
@@ -443,57 +542,62 @@ class IROperations:
 		# STEP 2: Loop through repeat_regions and attempt to identify IRs
 		IRa, IRb = self.identify_irs_in_repeat_features(all_repeat_features, IRa, IRb, min_IR_len)
 
+		# Both IRs annotated as sufficiently long repeat_regions: none of the following steps or sanity checks can change them
+		if IRa is not None and IRb is not None and len(IRa) >= min_IR_len and len(IRb) >= min_IR_len:
+			return IRa, IRb
+
 		# If no valid IRs found, check if the misc_features contain "note" qualifiers necessary for identification
 		if IRa is None and IRb is None:
-			all_qualifiers = [misc_feature.qualifiers for misc_feature in all_misc_features]
-			# The following line generates a nested list of all keys of all qualifiers found in all misc features
-			keylist = [list(q) for q in all_qualifiers]
-			if "note" not in [key for keys in keylist for key in keys]: # Flatten the key list
+			if not any("note" in misc_feature.qualifiers for misc_feature in all_misc_features):
 				raise Exception("Record does not contain any qualifiers for feature `misc_feature` which the IRs are typically named with (i.e., qualifier `note`).")
 
 		# STEP 3. Loop through misc_features and attempt to identify IRs
 		if IRa is None or IRb is None:
-			self.log.debug("%s out of 2 IR positions found so far. Checking all misc_features for identifying information in their NOTE QUALIFIERS..." % \
-			  (str([IRa is None, IRb is None].count(False))))
+			self.log.debug("%s out of 2 IR positions found so far. Checking all misc_features for identifying information in their NOTE QUALIFIERS...",
+			  [IRa is None, IRb is None].count(False))
 			IRa, IRb = self.identify_irs_in_misc_features(all_mf_no_pseudo, IRa, IRb)
 
 		# Sanity check for IRs selected by the script so far
-		if IRa is not None and len(IRa.extract(rec).seq) < min_IR_len:
+		if IRa is not None and len(IRa) < min_IR_len:
 			self.log.warning("Selected IRa is too short to be a genuine IR and has been discarded.")
 			IRa = None
-		if IRb is not None and len(IRb.extract(rec).seq) < min_IR_len:
+		if IRb is not None and len(IRb) < min_IR_len:
 			self.log.warning("Selected IRb is too short to be a genuine IR and has been discarded.")
 			IRb = None
 
+		# Both IRs annotated as misc_features (the most common case): the junction and single copy steps are not needed
+		if IRa is not None and IRb is not None:
+			return IRa, IRb
+
 		# STEP 4. Loop through misc_features and attempt to identify junctions from which to infer the IRs
 		if IRa is None or IRb is None:
-			self.log.debug("%s out of 2 IR positions found so far. Checking all misc_features for JUNCTION INFORMATION..." % \
-			  (str([IRa is None, IRb is None].count(False))))
+			self.log.debug("%s out of 2 IR positions found so far. Checking all misc_features for JUNCTION INFORMATION...",
+			  [IRa is None, IRb is None].count(False))
 			IRa, IRb = self.infer_irs_from_junctions(len(rec), all_misc_features)
 
 		# Sanity check for IRs selected by the script so far
-		if IRa is not None and len(IRa.extract(rec).seq) < min_IR_len:
+		if IRa is not None and len(IRa) < min_IR_len:
 			self.log.warning("Selected IRa is too short to be a genuine IR and has been discarded.")
 			IRa = None
-		if IRb is not None and len(IRb.extract(rec).seq) < min_IR_len:
+		if IRb is not None and len(IRb) < min_IR_len:
 			self.log.warning("Selected IRb is too short to be a genuine IR and has been discarded.")
 			IRb = None
 
 		# STEP 5. Inferring the position of the IR implicitly by extracting the positions of the large (LSC) and
 		# small single copy (SSC) regions and calculating the IRs as the complement set thereof.
 		if IRa is None or IRb is None:
-			self.log.debug("%s out of 2 IR positions found so far. Trying to infer the missing IRs by given single-copy region positions..." % \
-			  (str([IRa is None, IRb is None].count(False))))
+			self.log.debug("%s out of 2 IR positions found so far. Trying to infer the missing IRs by given single-copy region positions...",
+			  [IRa is None, IRb is None].count(False))
 			if len(all_mf_no_pseudo) == 0:
 				if IRa is None and IRb is None:
 					raise Exception("Record does not contain any features which the single-copy regions are typically marked with (i.e., feature `misc_feature`).")
 			IRa, IRb = self.infer_irs_from_single_copy_regions(len(rec), all_mf_no_pseudo, IRa, IRb)
 
 		# Sanity check for IRs selected by the script so far
-		if IRa is not None and len(IRa.extract(rec).seq) < min_IR_len:
+		if IRa is not None and len(IRa) < min_IR_len:
 			self.log.warning("Selected IRa is too short to be a genuine IR and has been discarded.")
 			IRa = None
-		if IRb is not None and len(IRb.extract(rec).seq) < min_IR_len:
+		if IRb is not None and len(IRb) < min_IR_len:
 			self.log.warning("Selected IRb is too short to be a genuine IR and has been discarded.")
 			IRb = None
 
@@ -520,7 +624,7 @@ class IROperations:
 			if feature.location.start == feature.location.end:
 				#feature.location = FeatureLocation(feature.location.start-1, feature.location.end, strand = feature.strand)  # Due to warning: BiopythonDeprecationWarning: Please use .location.strand rather than .strand
 				feature.location = FeatureLocation(feature.location.start-1, feature.location.end, strand = feature.location.strand)
-				self.log.debug("Adjusted FeatureLocation to %s" % str(feature.location))
+				self.log.debug("Adjusted FeatureLocation to %s", feature.location)
 		return feature
 
 	def collect_info_from_features(self, ira_feature, irb_feature):
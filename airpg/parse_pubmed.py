@@ -1,12 +1,14 @@
+import threading
 import entrezpy.base.analyzer
 import entrezpy.base.result
 import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import ElementTree
 
 class PubMedRecord():
+    # A single attribute per record; __slots__ avoids a per-instance __dict__
+    __slots__ = ("xml",)
 
-    def __init__(self):
-        self.xml = None
+    def __init__(self, xml = None):
+        self.xml = xml  # Element of the PubmedArticle
 
 class PubMedResult(entrezpy.base.result.EutilsResult):
 
@@ -18,12 +20,10 @@ class PubMedResult(entrezpy.base.result.EutilsResult):
         return len(self.pubmed_records)
 
     def isEmpty(self):
-        if not self.pubmed_records:
-            return True
-        return False
+        return not self.pubmed_records
 
     def dump(self):
-        return {self:{'dump':{'pubmed_records':[x for x in self.pubmed_records],
+        return {self:{'dump':{'pubmed_records':self.pubmed_records,
                                 'query_id': self.query_id, 'db':self.db,
                                 'eutil':self.function}}}
 
@@ -34,10 +34,12 @@ class PubMedAnalyzer(entrezpy.base.analyzer.EutilsAnalyzer):
 
     def __init__(self):
         super().__init__()
+        self.lock = threading.Lock()  # entrezpy may analyze responses from several threads
 
     def init_result(self, response, request):
-        if self.result is None:
-            self.result = PubMedResult(response, request)
+        with self.lock:
+            if self.result is None:
+                self.result = PubMedResult(response, request)
 
     def analyze_error(self, response, request):
         print(json.dumps({__name__:{'Response': {'dump' : request.dump(),
@@ -45,8 +47,18 @@ class PubMedAnalyzer(entrezpy.base.analyzer.EutilsAnalyzer):
 
     def analyze_result(self, response, request):
         self.init_result(response, request)
-        articleset = ET.fromstring(response.getvalue())
-        for article in list(articleset):
-            record = PubMedRecord()
-            record.xml = ElementTree(article)
-            self.result.add_pubmed_record(record)
+        # Parse the article set incrementally; each article (i.e., each child of the root element) is
+        # handed over as soon as it is complete and then detached from the root element
+        response.seek(0)
+        add_pubmed_record = self.result.pubmed_records.append
+        depth = 0
+        for event, elem in ET.iterparse(response, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    articleset = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                add_pubmed_record(PubMedRecord(elem))
+                articleset.remove(elem)
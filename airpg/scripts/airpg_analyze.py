@@ -51,10 +51,7 @@ NOTES:
 #####################
 # IMPORT OPERATIONS #
 #####################
-from Bio import SeqIO
-from fuzzywuzzy import fuzz
-from ete3 import NCBITaxa
-from pathlib import Path
+from rapidfuzz import fuzz
 from airpg import entrez_interaction
 from airpg import table_io
 from airpg import article_mining
@@ -62,7 +59,12 @@ from airpg import ir_operations
 import pandas as pd
 import os, argparse
 import tarfile, coloredlogs, logging
-import time
+try:
+    from isal import igzip as gzip  # ISA-L based; decompresses considerably faster than the standard library
+except ImportError:
+    import gzip
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 ###############
 # AUTHOR INFO #
@@ -77,13 +79,137 @@ __version__ = '2024.05.08.1700'
 #############
 # DEBUGGING #
 #############
-import ipdb
+#import ipdb
 # ipdb.set_trace()
 
 #############
 # FUNCTIONS #
 #############
 
+def init_worker(entrez_slot):
+    '''
+    Initializes a worker process of process_accession(), so that its requests to NCBI Entrez are spaced out
+    together with those of the main process and all other workers
+    Params:
+     - entrez_slot: multiprocessing.Value("d") shared by all processes (see entrez_interaction.share_request_throttle)
+    '''
+    entrez_interaction.share_request_throttle(entrez_slot)
+
+def process_accession(accession, args):
+    '''
+    Retrieves and analyzes the GenBank record of one accession; writes the FASTA files of the record and its IRs
+    and archives the GenBank flat file. Runs in a worker process.
+    Returns the IR information of the record (as collected by IROperations.collect_info_from_features)
+    or None if the record could not be analyzed.
+    Params:
+     - accession: accession number of the GenBank record
+     - args: the command line arguments
+    '''
+    accession = str(accession)
+    log = logging.getLogger(__name__)
+    iro = ir_operations.IROperations(log)
+    EI = entrez_interaction.EntrezInteraction(log)
+
+    acc_folder = os.path.join(args.datadir, accession)
+    try:
+        os.makedirs(acc_folder)
+    except FileExistsError:
+        log.warning("Folder for accession `%s` already exists. Skipping this accession." % (accession))
+        return None
+
+    # Step 3.1. Get flatfile (flat files fetched in batches by the main process are moved into the accession folder)
+    fp_fetched = os.path.join(args.recordsdir, accession + ".gb")
+    if os.path.isfile(fp_fetched):
+        log.info("Moving GenBank flat file for accession `%s`." % (accession))
+        fp_entry = os.path.join(acc_folder, accession + ".gb")
+        os.replace(fp_fetched, fp_entry)
+    elif not os.path.isfile(os.path.join(args.recordsdir, accession + ".tar.gz")):
+        log.info("Saving GenBank flat file for accession `%s`." % (accession))
+        if EI.internet_on():  # Check if internet connection active
+            try:
+                fp_entry = EI.fetch_gb_entry(accession, acc_folder)
+            except:
+                log.warning("Error retrieving accession `%s`. Skipping this accession." % (accession))
+                os.rmdir(acc_folder)
+                return None
+        else:  # If no internet connection, raise error
+            raise Exception("ERROR: No internet connection.")
+    else:
+        log.info("GenBank flat file for accession `%s` already exists. Extracting existing file." % (accession))
+        with gzip.open(os.path.join(args.recordsdir, accession + ".tar.gz"), "rb") as fh_archive:
+            tar = tarfile.open(fileobj=fh_archive, mode="r|")
+            tar.extractall(acc_folder)
+            tar.close()
+        fp_entry = os.path.join(acc_folder, accession + ".gb")
+
+    # Step 3.2. Parse and analyze flatfile
+    ir_info = None
+    try:
+        try:
+            # Only the features needed to identify the IRs are parsed
+            rec = iro.read_record(fp_entry, ir_features_only = True)
+        except Exception as err:
+            raise Exception("Error while parsing record of accession `%s`: `%s`. Skipping this accession." %
+            (accession, str(err)))
+
+        rec_id = str(rec.id).split('.')[0]
+        # Note: This internal check ensures that we are actually dealing with the record that was
+        # intended to be downloaded via efetch.
+        if not rec_id == accession:
+            log.warning("Accession number mismatch. Expected: `%s`. Retrieved: `%s`. Skipping this accession." % \
+              (accession, rec_id))
+            return None
+        log.info("Writing sequence as FASTA for accession `%s`." % (accession))
+        iro.write_sequence_to_fasta(str(rec.seq), ">" + accession + "_completeSequence", os.path.join(acc_folder, accession + "_completeSeq.fasta"))
+
+        ira_feature = None
+        irb_feature = None
+        try:
+            ira_feature, irb_feature = iro.identify_inverted_repeats(rec, 1000)
+            rev_comp = False
+            if ira_feature and irb_feature:
+                # The sequences are converted to strings once, so that they are compared without further conversion
+                ira_seq = str(ira_feature.extract(rec).seq)
+                irb_seq = str(irb_feature.extract(rec).seq)
+                rev_comp = irb_is_reverse_complemented(ira_seq, irb_seq, ir_operations.reverse_complement(irb_seq))
+            ir_info = iro.collect_info_from_features(ira_feature, irb_feature)
+        except Exception as err:
+            ir_info = iro.collect_info_from_features(ira_feature, irb_feature)
+            raise Exception("Error while extracting IRs for accession `%s`: `%s`. Skipping further processing of this accession." % (accession, str(err)))
+        iro.write_irs_to_fasta(rec, ira_feature, irb_feature, acc_folder, rev_comp)
+    except Exception as err:
+        log.warning(str(err))
+    finally:
+        if not os.path.isfile(os.path.join(args.recordsdir, accession + ".tar.gz")):
+            # The fastest gzip compression level suffices for a single, small text file per archive
+            tar = tarfile.open(os.path.join(args.recordsdir, accession + ".tar.gz"), "w:gz", compresslevel=1)
+            tar.add(fp_entry, os.path.basename(fp_entry))
+            tar.close()
+        os.remove(fp_entry)
+    return ir_info
+
+
+def irb_is_reverse_complemented(ira_seq, irb_seq, irb_seq_rc, prefix_len = 512, prefix_margin = 20):
+    '''
+    Evaluates if IRb is more similar to IRa when reverse complemented than as provided.
+    The starts of the sequences are compared first; only if they do not clearly favour
+    one orientation are the full sequences compared.
+    Params:
+     - ira_seq: string. Sequence of IRa
+     - irb_seq: string. Sequence of IRb
+     - irb_seq_rc: string. Reverse complement of the sequence of IRb
+     - prefix_len: number of nucleotides at the start of the sequences that are compared first
+     - prefix_margin: minimum difference between the similarity scores of the sequence starts that decides the orientation
+    '''
+    score_noRC = fuzz.ratio(ira_seq[:prefix_len], irb_seq[:prefix_len])
+    score_RC = fuzz.ratio(ira_seq[:prefix_len], irb_seq_rc[:prefix_len])
+    if abs(score_noRC - score_RC) >= prefix_margin:
+        return score_noRC < score_RC
+    score_noRC = fuzz.ratio(ira_seq, irb_seq)
+    # Scores below the cutoff are returned as 0, which permits an early exit of the comparison
+    score_RC = fuzz.ratio(ira_seq, irb_seq_rc, score_cutoff = score_noRC)
+    return score_noRC < score_RC
+
 
 def main(args):
 
@@ -95,114 +221,58 @@ def main(args):
         coloredlogs.install(fmt='%(asctime)s [%(levelname)s] %(message)s', level='INFO', logger=log)
     mail = args.mail
     query = args.query
-    iro = ir_operations.IROperations(log)
     EI = entrez_interaction.EntrezInteraction(log)
+    # NCBI limits the number of requests per second per user, not per process; hence, the requests of the main
+    # process and of all worker processes are spaced out together
+    entrez_slot = multiprocessing.Value("d", 0.0)
+    entrez_interaction.share_request_throttle(entrez_slot)
 
   # STEP 2. Read in accession numbers to loop over
-    tio = table_io.TableIO(args.infn, args.outfn, args.blocklist, logger = log)
+    tio = table_io.TableIO(args.infn, args.outfn, fp_blocklist = args.blocklist, logger = log)
     tio.remove_blocklisted_entries()
 
     accessions = list(tio.entry_table["ACCESSION"].values)
     if len(accessions) > 0:
-        if not os.path.exists(args.recordsdir):
-            os.makedirs(args.recordsdir)
-        if not os.path.exists(args.datadir):
-            os.makedirs(args.datadir)
-
-  # STEP 3. Loop over accession in inlist
-    for accession in accessions:
-        acc_folder = os.path.join(args.datadir, str(accession))
-        if not os.path.exists(acc_folder):
-            os.makedirs(acc_folder)
-        else:
-            log.warning("Folder for accession `%s` already exists. Skipping this accession." % (str(accession)))
-            continue
-
-        # Step 3.1. Get flatfile
-        if not os.path.isfile(os.path.join(args.recordsdir, accession + ".tar.gz")):
-            log.info("Saving GenBank flat file for accession `%s`." % (str(accession)))
-            if EI.internet_on():  # Check if internet connection active
-                try:
-                    fp_entry = EI.fetch_gb_entry(accession, acc_folder)
-                except:
-                    log.warning("Error retrieving accession `%s`. Skipping this accession." % (str(accession)))
-                    os.rmdir(acc_folder)
-                    continue
-            else:  # If no internet connection, raise error
-                raise Exception("ERROR: No internet connection.")
-        else:
-            log.info("GenBank flat file for accession `%s` already exists. Extracting existing file." % (str(accession)))
-            tar = tarfile.open(os.path.join(args.recordsdir, accession + ".tar.gz"), "r:gz")
-            tar.extractall(acc_folder)
-            tar.close()
-            fp_entry = os.path.join(acc_folder, accession + ".gb")
+        os.makedirs(args.recordsdir, exist_ok = True)
+        os.makedirs(args.datadir, exist_ok = True)
 
-        # Step 3.2. Parse and analyze flatfile
-        try:
-            try:
-                rec = SeqIO.read(fp_entry, "genbank")
-            except Exception as err:
-                raise Exception("Error while parsing record of accession `%s`: `%s`. Skipping this accession." %
-                (str(accession), str(err)))
-                continue
+  # STEP 3. Fetch the GenBank flat files of all accessions not processed or archived yet in batches
+    accessions_to_fetch = [accession for accession in accessions if not os.path.exists(os.path.join(args.datadir, accession))
+                           and not os.path.isfile(os.path.join(args.recordsdir, accession + ".tar.gz"))
+                           and not os.path.isfile(os.path.join(args.recordsdir, accession + ".gb"))]
+    if len(accessions_to_fetch) > 0:
+        log.info("Saving GenBank flat files for %s accessions." % (str(len(accessions_to_fetch))))
+        if EI.internet_on():  # Check if internet connection active
+            EI.fetch_gb_entries(accessions_to_fetch, args.recordsdir)
+        else:  # If no internet connection, raise error
+            raise Exception("ERROR: No internet connection.")
 
-            rec_id = str(rec.id).split('.')[0]
-            # Note: This internal check ensures that we are actually dealing with the record that was
-            # intended to be downloaded via efetch.
-            if not rec_id == str(accession):
-                log.warning("Accession number mismatch. Expected: `%s`. Retrieved: `%s`. Skipping this accession." % \
-                  (str(accession), rec_id))
+  # STEP 4. Process the accessions in parallel; the IR information is collected in the main process
+    ir_rows = []  # The rows are added to the IR table at once after the loop, not one by one
+    # The IR information appended one accession at a time is buffered by the TableIO until the with-block is left
+    with tio, ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(entrez_slot,)) as executor:
+        futures = [executor.submit(process_accession, accession, args) for accession in accessions]
+        # The results are collected in the order of the input accessions, so that the rows of the IR table
+        # do not depend on which worker finishes first
+        for accession, future in zip(accessions, futures):
+            ir_info = future.result()
+            if ir_info is None:
                 continue
-            log.info("Writing sequence as FASTA for accession `%s`." % (str(accession)))
-            iro.write_sequence_to_fasta(str(rec.seq), ">" + str(accession) + "_completeSequence", os.path.join(acc_folder, str(accession) + "_completeSeq.fasta"))
-
-            ira_feature = None
-            irb_feature = None
-            if not str(accession) in tio.ir_table.index:
-                #tio.ir_table = tio.ir_table.append(pd.Series(name=str(accession), dtype='float64'))  # As of pandas 2.0, append (previously deprecated) was removed.
-                tio.ir_table = pd.concat([tio.ir_table, pd.Series(name=str(accession), dtype='float64')])
-            try:
-                ira_feature, irb_feature = iro.identify_inverted_repeats(rec, 1000)
-                rev_comp = False
-                if ira_feature and irb_feature:
-                    score_noRC = fuzz.ratio(ira_feature.extract(rec).seq,
-                                            irb_feature.extract(rec).seq)
-                    score_RC = fuzz.ratio(ira_feature.extract(rec).seq,
-                                          irb_feature.extract(rec).seq.reverse_complement())
-                    if score_noRC < score_RC:
-                        rev_comp = True
-                ir_info = iro.collect_info_from_features(ira_feature, irb_feature)
-                tio.ir_table.loc[accession] = ir_info
-                tio.append_ir_info_to_table(ir_info, accession, args.outfn)
-            except Exception as err:
-                ir_info = iro.collect_info_from_features(ira_feature, irb_feature)
-                tio.ir_table.loc[accession] = ir_info
-                tio.append_ir_info_to_table(ir_info, accession, args.outfn)
-                raise Exception("Error while extracting IRs for accession `%s`: `%s`. Skipping further processing of this accession." % (str(accession), str(err)))
-                continue
-            tio.ir_table.loc[accession] = iro.collect_info_from_features(ira_feature, irb_feature)
-            # TODO: Currently, nothing is done with the table object, since the file is written entry-wise. Remove full table from use?
-            iro.write_irs_to_fasta(rec, ira_feature, irb_feature, acc_folder, rev_comp)
-        except Exception as err:
-            log.warning(str(err))
-        finally:
-            if not os.path.isfile(os.path.join(args.recordsdir, accession + ".tar.gz")):
-                tar = tarfile.open(os.path.join(args.recordsdir, accession + ".tar.gz"), "w:gz")
-                tar.add(fp_entry, os.path.basename(fp_entry))
-                tar.close()
-            os.remove(fp_entry)
-
-  # STEP 4. Check every accession for IR loss in literature and remove from outlist if so published
+            ir_rows.append(dict(ir_info, ACCESSION=accession))
+            tio.append_ir_info_to_table(ir_info, accession, args.outfn)
+    if len(ir_rows) > 0:
+        new_ir_table = pd.DataFrame(ir_rows).set_index("ACCESSION", drop = True)
+        tio.ir_table = pd.concat([tio.ir_table.drop(new_ir_table.index, errors = "ignore"), new_ir_table])
+
+  # STEP 5. Check every accession for IR loss in literature and remove from outlist if so published
     if EI.internet_on():  # Check if internet connection active
         am = article_mining.ArticleMining(log)
         articles = EI.fetch_pubmed_articles(mail, query)
-        ncbi = NCBITaxa()
-        # Update database if it is older than one month
-        if (time.time() - os.path.getmtime(os.path.join(Path.home(), ".etetoolkit/taxa.sqlite"))) > 2592000:
-            ncbi.update_taxonomy_database()
         article_genera = set()
-        for article in articles:
-            article_genera.union(am.get_genera_from_pubmed_article(article, ncbi))
+        # The NCBI Taxonomy database is only loaded (and its age checked) if there are articles to look up
+        if articles:
+            for genera in am.get_genera_from_pubmed_articles(articles, article_mining.get_ncbi_taxa()).values():
+                article_genera.update(genera)
         tio.read_ir_table(args.outfn)
         tio.remove_naturally_irl_genera(article_genera)
         tio.write_ir_table(args.outfn)
@@ -222,6 +292,7 @@ if __name__ == "__main__":
     parser.add_argument("--query", "-q", type=str, required=False, default="inverted[TITLE] AND repeat[TITLE] AND loss[TITLE]", help="(Optional) Entrez string to query NCBI PubMed")
     parser.add_argument("--recordsdir", "-r", type=str, required=False, default="./records/", help="(Optional) Path to records directory")
     parser.add_argument("--datadir", "-d", type=str, required=False, default="./data/", help="(Optional) Path to data directory")
+    parser.add_argument("--workers", "-w", type=int, required=False, default=os.cpu_count(), help="(Optional) Number of accessions processed in parallel")
     parser.add_argument("--verbose", "-v", action="store_true", required=False, default=False, help="(Optional) Enable verbose logging")
     args = parser.parse_args()
     #if bool(args.query) ^ bool(args.mail):
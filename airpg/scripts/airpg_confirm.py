@@ -27,8 +27,9 @@ TO DO (FUTURE VERSIONS OF AIRPG):
 #####################
 # IMPORT OPERATIONS #
 #####################
-import os, argparse
-import pandas as pd
+import os, argparse, threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import coloredlogs, logging
 from airpg import self_blasting
 from airpg import table_io
@@ -53,14 +54,93 @@ __version__ = '2024.05.08.1700'
 # FUNCTIONS #
 #############
 
-## THE FOLLOWING LINES CAN BE IMPLEMENTED IN A FUTURE VERSION OF AIRPG:
-#def coerceToExactLocation(location):
-#    exactLocation = None
-#    if '<' in str(location) or '>' in str(location):
-#        exactLocation = str(location)[1:]
-#    else:
-#        exactLocation = str(location)
-#    return exactLocation
+# Number of BLAST searches run concurrently; blastn runs single-threaded when searching against a subject sequence,
+# so one search is run per CPU
+CONCURRENT_BLAST_SEARCHES = os.cpu_count() or 1
+
+# One SelfBlasting instance per worker thread, which is bound to each accession BLASTed by the thread
+_blasters = threading.local()
+
+def blast_accession(accession, seq_FASTA, args, log):
+    '''
+    Infers the IR positions of one accession through self-BLASTing its complete sequence and returns them
+    as dictionary of column name/value pairs, or None if the BLAST search failed. Runs in a worker thread.
+    Params:
+     - accession: accession number
+     - seq_FASTA: file path to the complete sequence of the accession in FASTA format
+     - args: the command line arguments
+     - log: logger
+    '''
+    # Infer IR positions through self-BLASTing the sequence against itself as subject, which requires no BLAST database
+    try:
+        if not hasattr(_blasters, "blaster"):
+            _blasters.blaster = self_blasting.SelfBlasting(logger = log)
+        blaster = _blasters.blaster.bind(seq_FASTA, accession)
+        log.info("Self-BLASTing FASTA file of accession `%s` to identify the IRs.", accession)
+        result_hits = blaster.infer_irs(args.minlength, args.maxlength)
+    except Exception as err:
+        log.warning("Error while self-BLASTing FASTA file of accession `%s`: %s.\nSkipping this accession.", accession, err)
+        return None
+
+    # Parse output of self-BLASTing
+    # Note: BLAST sometimes finds additional regions in the sequence that match the length requirements filtered for in SelfBlasting.infer_irs. We only want the IRs, and therefore need to pick out the two regions with matching length
+    # Each hit is a tuple of integers (length, query start, query end, subject start, subject end)
+    if len(result_hits) > 2:
+        # Group the regions by their matching value in a single pass and keep the first group of at least two regions
+        groups = defaultdict(list)
+        for hit in result_hits:
+            groups[hit[1]].append(hit)
+        result_hits = next((group[:2] for group in groups.values() if len(group) >= 2), result_hits)
+
+    if len(result_hits) == 2:
+        # Compare the start positions of the found regions. By default, we assume IRb is located before IRa in the sequence
+        if result_hits[0][1] > result_hits[1][1]:
+            IRb_info, IRa_info = result_hits
+        else:
+            IRa_info, IRb_info = result_hits
+
+        # Save data into correct columns
+        # Note: It is important to stay within the condition 'len(result_hits) == 2'
+        blast_info = {}
+        blast_info["IRa_BLASTINFERRED"] = "yes"
+        blast_info["IRb_BLASTINFERRED"] = "yes"
+        blast_info["IRa_BLASTINFERRED_START"] = IRa_info[1]
+        blast_info["IRb_BLASTINFERRED_START"] = IRb_info[1]
+        blast_info["IRa_BLASTINFERRED_END"] = IRa_info[2]
+        blast_info["IRb_BLASTINFERRED_END"] = IRb_info[2]
+        blast_info["IRa_BLASTINFERRED_LENGTH"] = IRa_info[0]
+        blast_info["IRb_BLASTINFERRED_LENGTH"] = IRb_info[0]
+
+    else:
+        log.info("Could not infer IRs for accession `%s`:\n%s.", accession, "\n".join([" ".join(map(str, hit)) for hit in result_hits]))
+        blast_info = {}
+        blast_info["IRa_BLASTINFERRED"] = "no"
+        blast_info["IRb_BLASTINFERRED"] = "no"
+        blast_info["IRa_BLASTINFERRED_START"] = "n.a."
+        blast_info["IRb_BLASTINFERRED_START"] = "n.a."
+        blast_info["IRa_BLASTINFERRED_END"] = "n.a."
+        blast_info["IRb_BLASTINFERRED_END"] = "n.a."
+        blast_info["IRa_BLASTINFERRED_LENGTH"] = "n.a."
+        blast_info["IRb_BLASTINFERRED_LENGTH"] = "n.a."
+    return blast_info
+
+
+def iter_blast_infos(futures, ir_records):
+    '''
+    Yields the accession number and the combined reported and BLAST-inferred IR information of each
+    accession in the order in which the BLAST searches were submitted, so that the rows of the outfile do not
+    depend on which search finishes first; accessions whose BLAST search failed are skipped.
+    Params:
+     - futures: list of accession number/future pairs, as submitted with blast_accession
+     - ir_records: dict of accession number/dict pairs holding the reported IR information of each accession
+    '''
+    for accession, future in futures:
+        blast_info = future.result()
+        if blast_info is None:
+            continue
+
+        # Combine selfblast data with the reported IR information
+        yield accession, {**ir_records[accession], **blast_info}
 
 
 def main(args):
@@ -75,108 +155,32 @@ def main(args):
     infile = os.path.abspath(args.infn)
     outfile = os.path.abspath(args.outfn)
     tio = table_io.TableIO(fp_ir_table = infile, fp_blast_table = outfile, logger = log)
-    accessions = list(tio.ir_table.index.values)
+    # The rows of the table are converted to dicts once, so that each accession's row is looked up by a single dict access
+    ir_records = tio.ir_table.to_dict("index")
+    accessions = list(ir_records.keys())
+    # Accessions already contained in the outfile (e.g., from an interrupted run) are not BLASTed again
+    done_accessions = set(tio.blast_table.index.values)
+    if done_accessions:
+        log.info("Skipping %s accessions already contained in outfile.", len(done_accessions))
+        accessions = [accession for accession in accessions if accession not in done_accessions]
     
-  # STEP 4. Loop over accession in inlist
-    # Step 4.1. Check if FASTA file for accession exists
-    main_dir = os.getcwd()
+  # STEP 3. Locate the complete sequences of the accessions
+    datadir = os.path.abspath(args.datadir)
+    seqs_FASTA = {}
     for accession in accessions:
-        try:
-            acc_folder = os.path.join(args.datadir, str(accession))
-            seq_FASTA = accession + "_completeSeq.fasta"
-        except Exception as err:
-            log.warning("Error accessing FASTA file of accession `%s`: %s.\nSkipping this accession." % (str(accession), str(err)))
-            continue
-            
-        # Step 4.2. Change into accession folder and conduct BLAST locally
-        # Change to directory containing sequence files
-        os.chdir(acc_folder)
-        # Substep 1: Set up local BLAST database
-        blaster = self_blasting.SelfBlasting(seq_FASTA, accession, log)        
-        try:
-            log.info("Creating local BLAST database for accession `%s`." % (str(accession)))
-            blaster.setup_blast_db()
-        except Exception as err:
-            log.exception("Error creating local BLAST database for accession `%s`: %s\nSkipping this accession." % (str(accession), str(err)))
-            continue
-
-        # Substep 2: Infer IR positions through self-BLASTing
-        try:
-            log.info("Self-BLASTing FASTA file of accession `%s` to identify the IRs." % (str(accession)))
-            result_lines = blaster.infer_irs(args.minlength, args.maxlength)
-        except Exception as err:
-            log.warning("Error while self-BLASTing FASTA file of accession `%s`: %s.\nSkipping this accession." % (str(accession), str(err)))
-            continue
+        seq_FASTA = os.path.join(datadir, accession, accession + "_completeSeq.fasta")
+        if os.path.isfile(seq_FASTA):
+            seqs_FASTA[accession] = seq_FASTA
+        else:
+            log.warning("FASTA file of accession `%s` not found. Skipping this accession.", accession)
+    accessions = list(seqs_FASTA.keys())
 
-        # Substep 3: Compress local BLAST database if BLAST output received
-        if len(result_lines) != 0:
-            try:
-                blaster.compress_db()                
-            except Exception as err:
-                log.warning("Error while compressing local BLAST database for accession `%s`: %s." % (str(accession), str(err)))
-
-        # Step 4.3. Parse output of self-BLASTing
-        # Note: BLAST sometimes finds additional regions in the sequence that match the length requirements filtered for in awk. We only want the IRs, and therefore need to pick out the two regions with matching length
-        if len(result_lines) > 2:
-            temp_lines = []
-            for i in range(len(result_lines)-1):
-                for j in range(i+1,len(result_lines)):
-                    if result_lines[i].split()[1] == result_lines[j].split()[1]:
-                        temp_lines.append(result_lines[i])
-                        temp_lines.append(result_lines[j])
-                        break
-            result_lines = temp_lines
-
-        if len(result_lines) == 2:
-            # Compare the start positions of the found regions. By default, we assume IRb is located before IRa in the sequence
-            if result_lines[0].split()[1] > result_lines[1].split()[1]:
-                IRa_info = result_lines[1].split()
-                IRb_info = result_lines[0].split()
-            else:
-                IRa_info = result_lines[0].split()
-                IRb_info = result_lines[1].split()
-
-        # Step 4.4. Save data into correct columns
-        # Note: It is important to stay within the condition 'len(result_lines) == 2'
-            blast_info = {}
-            blast_info["IRa_BLASTINFERRED"] = "yes"
-            blast_info["IRb_BLASTINFERRED"] = "yes"
-            blast_info["IRa_BLASTINFERRED_START"] = int(IRa_info[1])
-            blast_info["IRb_BLASTINFERRED_START"] = int(IRb_info[1])
-            blast_info["IRa_BLASTINFERRED_END"] = int(IRa_info[2])
-            blast_info["IRb_BLASTINFERRED_END"] = int(IRb_info[2])
-            blast_info["IRa_BLASTINFERRED_LENGTH"] = int(IRa_info[0])
-            blast_info["IRb_BLASTINFERRED_LENGTH"] = int(IRb_info[0])
-
-            ## THE FOLLOWING LINES CAN BE IMPLEMENTED IN A FUTURE VERSION OF AIRPG:
-            #            IR_table.at[accession, "IRa_START_COMPARED_OFFSET"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRa_REPORTED_START"])) - float(coerceToExactLocation(IR_table.at[accession, "IRa_BLASTINFERRED_START"])))
-            #            IR_table.at[accession, "IRb_START_COMPARED_OFFSET"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRb_REPORTED_START"])) - float(coerceToExactLocation(IR_table.at[accession, "IRb_BLASTINFERRED_START"])))
-
-            #            IR_table.at[accession, "IRa_END_COMPARED_OFFSET"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRa_REPORTED_END"])) - float(coerceToExactLocation(IR_table.at[accession, "IRa_BLASTINFERRED_END"])))
-            #            IR_table.at[accession, "IRb_END_COMPARED_OFFSET"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRb_REPORTED_END"])) - float(coerceToExactLocation(IR_table.at[accession, "IRb_BLASTINFERRED_END"])))
-
-            #            IR_table.at[accession, "IRa_LENGTH_COMPARED_DIFFERENCE"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRa_REPORTED_LENGTH"])) - float(coerceToExactLocation(IR_table.at[accession, "IRa_BLASTINFERRED_LENGTH"])))
-            #            IR_table.at[accession, "IRb_LENGTH_COMPARED_DIFFERENCE"] = int(float(coerceToExactLocation(IR_table.at[accession, "IRb_REPORTED_LENGTH"])) - float(coerceToExactLocation(IR_table.at[accession, "IRb_BLASTINFERRED_LENGTH"])))
+  # STEP 4. Self-BLAST the accessions concurrently (BLAST runs in external processes, so threads suffice)
+    with ThreadPoolExecutor(max_workers = CONCURRENT_BLAST_SEARCHES) as executor:
+        futures = [(accession, executor.submit(blast_accession, accession, seqs_FASTA[accession], args, log)) for accession in accessions]
 
-        else:
-            log.info("Could not infer IRs for accession `%s`:\n%s." % (str(accession), "\n".join([str(line).strip() for line in result_lines])))    # Note: The following part of this lines does not always work:  >>> "\n".join([str(line).strip() for line in result_lines] <<<
-            blast_info = {}
-            blast_info["IRa_BLASTINFERRED"] = "no"
-            blast_info["IRb_BLASTINFERRED"] = "no"
-            blast_info["IRa_BLASTINFERRED_START"] = "n.a."
-            blast_info["IRb_BLASTINFERRED_START"] = "n.a."
-            blast_info["IRa_BLASTINFERRED_END"] = "n.a."
-            blast_info["IRb_BLASTINFERRED_END"] = "n.a."
-            blast_info["IRa_BLASTINFERRED_LENGTH"] = "n.a."
-            blast_info["IRb_BLASTINFERRED_LENGTH"] = "n.a."
-        
-        # Step 4.5. Append selfblast data to outfile
-        #blast_info = tio.ir_table.loc[accession].append(pd.Series(blast_info)).to_dict()  # As of pandas 2.0, append (previously deprecated) was removed.
-        blast_info = pd.concat([tio.ir_table.loc[accession], pd.Series(blast_info)]).to_dict()
-        tio.append_blast_info_to_table(blast_info, accession, outfile)
-
-        # Step 4.6. Change back to main directory
-        os.chdir(main_dir)
+  # STEP 5. Append selfblast data to outfile in the order of the accessions, while later accessions are still BLASTed
+        tio.append_blast_infos_to_table(iter_blast_infos(futures, ir_records), outfile)
 
 
 ########
@@ -22,7 +22,6 @@ DESIGN:
     There are thousands of plastid genome sequences on GenBank. The parsing of the records is, thus, conducted one by one, not all simultaneously. Specifically, a list of unique identifiers is first obtained and then this list is looped over.
 
 TO DO:
-    * Currently, the output table is written anew every single time, even if merely a single line is added to it at the end. The reason: tio.write_entry_table(outfn) is executed without respect to append-argument or not.
 	* The duplicates tables is written anew every single time, even if there was no update to it.
 
 NOTES:
@@ -61,6 +60,9 @@ __version__ = '2024.05.09.1730'
 # FUNCTIONS #
 #############
 
+# Number of parsed entries that are added to the entry table at once
+ENTRY_BLOCK_SIZE = 500
+
 
 def main(args):
 
@@ -68,10 +70,10 @@ def main(args):
     log = logging.getLogger(__name__)
     coloredlogs.install(fmt='%(asctime)s [%(levelname)s] %(message)s', level='DEBUG', logger=log)
 
-    EI = entrez_interaction.EntrezInteraction(log)
+    EI = entrez_interaction.EntrezInteraction(log, api_key = args.api_key)
 
   # STEP 2. Check if output file already exists, read existing UIDs, infer mindate
-    uids_already_processed = []
+    uids_already_processed = set()
     min_date = None
     outfn = os.path.abspath(args.outfn)
 
@@ -82,10 +84,10 @@ def main(args):
     fp_duplicates = os.path.join(os.path.dirname(outfn), os.path.basename(outfn) + ".duplicates")
     if os.path.isfile(fp_duplicates):
         tio.read_duplicates(fp_duplicates)
-        uids_already_processed.extend(map(int, tio.duplicates.keys()))
+        uids_already_processed.update(map(int, tio.duplicates.keys()))
 
     if len(tio.entry_table) > 0:
-        uids_already_processed.extend(list(tio.entry_table.index.values))
+        uids_already_processed.update(tio.entry_table.index.astype(int, copy = False).tolist())
         log.info("Summary file '%s' already exists. Number of UIDs (unique and duplicates) parsed: %s" % (str(outfn), str(len(uids_already_processed))))
         if args.update_only:
             min_date = datetime.strptime(tio.entry_table["CREATE_DATE"].max(), '%Y-%m-%d')
@@ -102,30 +104,38 @@ def main(args):
     else:  # If no internet connection, raise error
         raise Exception("ERROR: No internet connection.")
     log.info(("Number of UIDs on NCBI: %s" % (str(len(uids_new)))))
-    uids_to_process = set(uids_new) - set(uids_already_processed)
+    uids_to_process = set(uids_new).difference(uids_already_processed)
     log.info(("Number of UIDs to be processed: %s" % (str(len(uids_to_process)))))
 
     # STEP 4. Parse all entries, append entry-wise to file
     if uids_to_process:
-        for uid in uids_to_process:
+        if not EI.internet_on():  # Check if internet connection active
+            raise Exception("ERROR: No internet connection.")
+        # Entries are fetched in batches of UIDs, several batches at a time
+        entries = {}
+        for uid, xml_entry in EI.fetch_xml_entries(uids_to_process):
             log.info(("Reading and parsing UID '%s', writing to '%s'." % (str(uid), str(outfn))))
-            if EI.internet_on():  # Check if internet connection active
-                try:
-                    xml_entry = EI.fetch_xml_entry(uid)
-                    parsed_entry = EI.parse_xml_entry(xml_entry)
-                except Exception as err:
-                    log.exception("Error retrieving info for UID " + str(uid) + ": " + str(err) + "\nSkipping this accession.")
-                    continue
-            else:  # If no internet connection, raise error
-                raise Exception("ERROR: No internet connection.")
+            try:
+                parsed_entry = EI.parse_xml_entry(xml_entry)
+            except Exception as err:
+                log.exception("Error retrieving info for UID " + str(uid) + ": " + str(err) + "\nSkipping this accession.")
+                continue
             duplseq = parsed_entry.pop("DUPLSEQ") # .pop() saved value of "DUPLSEQ" to duplseq
-            tio.entry_table.loc[uid] = parsed_entry
+            entries[uid] = parsed_entry
             if duplseq:
                 tio.duplicates[uid] = [parsed_entry["ACCESSION"], duplseq]
-            tio.append_entry_to_table(parsed_entry, uid, outfn)  ## TO BE IMPROVED: This line is currently useless because the entire table is written to file in full below anyways (which is an overkill)
+            # The parsed entries are appended to file in blocks rather than one by one; they are not kept in memory
+            if len(entries) >= ENTRY_BLOCK_SIZE:
+                tio.append_entries_to_table(entries, outfn, update_table = False)
+                entries = {}
+        if entries:
+            tio.append_entries_to_table(entries, outfn, update_table = False)
+        # The complete entry table is read back from file once all entries are written
+        tio.read_entry_table(outfn)
 
         # STEP 5. Remove duplicates of REFSEQs and blocklisted entries
         tio.write_duplicates(fp_duplicates)  ## TO BE IMPROVED: This function overwrites the original duplicates file even if there are no additional duplicates that had been added.
+        num_entries = len(tio.entry_table)
         tio.remove_duplicates()
         tio.remove_blocklisted_entries()
         '''
@@ -138,8 +148,12 @@ def main(args):
                 log.info("Could not find accession '%s' when trying to remove it." % str(dup))
         '''
 
-        # STEP 6. Write output table
-        tio.write_entry_table(outfn)  ## TO BE IMPROVED: There should not be a reason why the full table is written anew if there is merely a small update.
+        # STEP 6. Write output table; the new entries have already been appended to it, so it is only written anew
+        # if entries were removed
+        if len(tio.entry_table) < num_entries:
+            tio.write_entry_table(outfn)
+        else:
+            log.info("No entries removed; output table not written anew.")
 
 ########
 # MAIN #
@@ -150,6 +164,7 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--outfn", type=str, required=True, help="Path to output file")
     parser.add_argument("-q", "--query", type=str, required=False, default="complete genome[TITLE] AND (chloroplast[TITLE] OR plastid[TITLE]) AND 50000:250000[SLEN] NOT unverified[TITLE] NOT partial[TITLE] AND Magnoliopsida[ORGN]", help="(Optional) Entrez query that will replace the standard query")
     parser.add_argument("-b", "--blocklist", type=str, required=False, help="(Optional) Path to file of blocklisted genera that will be removed from the retrieved plastid sequences")
+    parser.add_argument("-k", "--api_key", type=str, required=False, help="(Optional) NCBI API key, which permits 10 instead of 3 requests per second (default: environment variable NCBI_API_KEY)")
     parser.add_argument("-u", "--update_only", action="store_true", required=False, default=False, help="(Optional) Only add entries with more recent creation date than the most recent existing entry")
     args = parser.parse_args()
     main(args)
@@ -18,13 +18,9 @@ NOTES:
 import os.path
 import argparse
 import coloredlogs, logging
-import time
-from airpg import table_io
 from airpg import article_mining as AM
-from airpg import entrez_interaction as EI
-from ete3 import NCBITaxa
-from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 
 # For suppressing console output
 import io
@@ -42,23 +38,31 @@ __version__ = '2021.09.17.1500'
 #############
 # DEBUGGING #
 #############
-import ipdb
+#import ipdb
 # ipdb.set_trace()
 
-def get_irl_clade_species(ncbi):
-    species_ids = []
-    irl_clade_tree = ncbi.get_topology([ncbi.get_name_translator(['IRL clade'])['IRL clade'][0]])
-    for leaf in irl_clade_tree.iter_leaves():
-         species_ids.append(int(leaf.name))
+@lru_cache(maxsize=None)
+def get_irl_clade_tree(ncbi):
+    '''
+    Looks up the taxid of the IRL clade and builds its topology once per NCBITaxa instance,
+    so that the species and the genus names are collected from the same tree
+    '''
+    return ncbi.get_topology([ncbi.get_name_translator(['IRL clade'])['IRL clade'][0]])
+
+def get_irl_clade_species(ncbi = None):
+    ncbi = ncbi or AM.get_ncbi_taxa()
+    irl_clade_tree = get_irl_clade_tree(ncbi)
+    species_ids = [int(leaf.name) for leaf in irl_clade_tree.iter_leaves()]
     species = set(ncbi.translate_to_names(species_ids))
     return species
 
-def get_irl_clade_genera(ncbi):
-    genera_ids = []
-    irl_clade_tree = ncbi.get_topology([ncbi.get_name_translator(['IRL clade'])['IRL clade'][0]])
-    for node in irl_clade_tree.iter_descendants():
-        if ncbi.get_rank([int(node.name)])[int(node.name)] == "genus":
-            genera_ids.append(int(node.name))
+def get_irl_clade_genera(ncbi = None):
+    ncbi = ncbi or AM.get_ncbi_taxa()
+    irl_clade_tree = get_irl_clade_tree(ncbi)
+    node_ids = [int(node.name) for node in irl_clade_tree.iter_descendants()]
+    # The ranks of all nodes are retrieved in a single query
+    ranks = ncbi.get_rank(node_ids)
+    genera_ids = [node_id for node_id in node_ids if ranks.get(node_id) == "genus"]
     genera = set(ncbi.translate_to_names(genera_ids))
     return genera
 
@@ -68,24 +72,22 @@ def read_blocklist(fp_blocklist):
     Params:
      - fp_blocklist: file path to input file
     '''
-    blocklist = set()
     with open(fp_blocklist, "r") as fh_blocklist:
-        for line in [l.strip() for l in fh_blocklist.readlines()]:
-            if not line.startswith("#"):
-                blocklist.add(line)
-    return blocklist
+        # Comment lines and empty lines are skipped
+        return frozenset(line.strip() for line in fh_blocklist if line.strip() and not line.lstrip().startswith("#"))
 
 def write_blocklist(fp_blocklist, blocklist):
     with open(fp_blocklist, "w") as fh_blocklist:
         fh_blocklist.write("# Blocklist as of %s\n" % datetime.now().strftime("%Y-%m-%d, %H:%M"))
-        for entry in blocklist:
-            fh_blocklist.write(entry + "\n")
+        fh_blocklist.write("".join(entry + "\n" for entry in blocklist))
 
 def append_blocklist(fp_blocklist, blocklist):
+    if not blocklist:  # No update header without entries
+        return
     with open(fp_blocklist, "a") as fh_blocklist:
         fh_blocklist.write("# Update on %s\n" % datetime.now().strftime("%Y-%m-%d, %H:%M"))
-        for entry in blocklist:
-            fh_blocklist.write(entry + "\n")
+        # The entries are sorted, so that successive updates of the file are easy to compare
+        fh_blocklist.write("".join(entry + "\n" for entry in sorted(blocklist)))
 
 def main(args):
 
@@ -94,12 +96,8 @@ def main(args):
     coloredlogs.install(fmt='%(asctime)s [%(levelname)s] %(message)s', level='INFO', logger=log)
 
     ## STEP 2. Initialize variables
-    ncbi = NCBITaxa()
-    # Update database if it is older than one month
-    if (time.time() - os.path.getmtime(os.path.join(Path.home(), ".etetoolkit/taxa.sqlite"))) > 2592000:
-        ncbi.update_taxonomy_database()
     blocklist = set()
-    blocklist_existing = set()
+    blocklist_existing = frozenset()
 
     ## STEP 3. Read blocklist if the file already exists
     if os.path.isfile(args.file_blocklist):
@@ -109,59 +107,59 @@ def main(args):
     ## STEP 4a. Collect genus names of IRL clade of Fabaceae
     log.info("Fetching genus names of taxa in 'IRL clade' of Fabaceae ...")
     try:
-        irl_clade_genera = get_irl_clade_genera(ncbi)
+        irl_clade_genera = get_irl_clade_genera()
     except:
         irl_clade_genera = set()    
     log.info("Adding new genus names to blocklist ...")
-    blocklist = set(list(irl_clade_genera.union(blocklist_existing)))
+    blocklist = set(blocklist_existing)
+    blocklist |= irl_clade_genera
 
     ## STEP 4b. Collect species names of IRL clade of Fabaceae
     log.info("Fetching species names of taxa in 'IRL clade' of Fabaceae ...")
     try:
-        irl_clade_species = get_irl_clade_species(ncbi)
+        irl_clade_species = get_irl_clade_species()
     except:
         irl_clade_species = set()    
     log.info("Adding new species names to blocklist ...")
-    blocklist = set(list(irl_clade_species.union(blocklist)))
+    blocklist |= irl_clade_species
     
     ## STEP 5. Conduct the search on NCBI PubMed
     if args.query and args.mail:
         log.info("Querying NCBI Pubmed for taxon names ...")
+        from airpg import entrez_interaction as EI  # Only imported if PubMed is queried, since it loads entrezpy
+        am = AM.ArticleMining(log)
+        ei = EI.EntrezInteraction(log, api_key = args.api_key)
+        articles = []
         try:
-            irl_clade_genera = set()
-            am = AM.ArticleMining(log)
-            ei = EI.EntrezInteraction(log)
             if ei.internet_on():  # Check if internet connection active
                 articles = ei.fetch_pubmed_articles(args.mail, args.query)
             else:  # If no internet connection, raise error
                 raise Exception("ERROR: No internet connection.")
-            ncbi = NCBITaxa()
-            # Update database if it is older than 1 month
-            if (time.time() - os.path.getmtime(os.path.join(Path.home(), ".etetoolkit/taxa.sqlite"))) > 2592000:
-                ncbi.update_taxonomy_database()
-            article_genera = set()
-            for article in articles:
-                article_genera.union(am.get_genera_from_pubmed_article(article, ncbi))
-        except:
-            article_genera = set()    
-        blocklist = blocklist.union(article_genera)
+        except Exception as err:
+            log.warning("Error while querying NCBI PubMed: %s" % (str(err)))
+        # The candidate genus names of all articles are resolved in a single taxonomy lookup
+        if articles:
+            for genera in am.get_genera_from_pubmed_articles(articles, AM.get_ncbi_taxa()).values():
+                blocklist |= genera
 
     ## STEP 6. Keeping only species name if corresponding genus name present
     log.info("Removing genus names if individual species of genus in list ...")
-    species_names = list()
+    species_names = set()  # Making sure that no two lines are identical
     genus_names = set()
     genus_epithets = set()
     for line in blocklist:
-        first, *rest = line.split()
-        if rest:
-            species_names.append(line)
+        first, sep, _ = line.partition(" ")
+        if sep:
+            species_names.add(line)
             genus_epithets.add(first)
         else:
             genus_names.add(first)
-    species_names.extend(genus_names - genus_epithets)
-    blocklist = set(species_names)  # Making sure that no two lines are identical
+    blocklist = species_names | (genus_names - genus_epithets)
 
     ## STEP 7. Write updated blocklist to file or replace old blocklist
+    if os.path.isfile(args.file_blocklist) and blocklist == blocklist_existing:
+        log.info("Blocklist unchanged; file not rewritten.")
+        return
     log.info("Writing updated blocklist to file ...")
     #append_blocklist(args.file_blocklist, blocklist)
     write_blocklist(args.file_blocklist, sorted(blocklist))
@@ -172,5 +170,6 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--file_blocklist", type=str, required=True, help="Path to blocklist file")
     parser.add_argument("-q", "--query", type=str, required=False, default="inverted[TITLE] AND repeat[TITLE] AND loss[TITLE]", help="(Optional) Entrez string to query NCBI PubMed")
     parser.add_argument("-m", "--mail", type=str, required=False, help="(Optional) Mail address needed for Entrez search on NCBI PubMed (any valid mail address works)")
+    parser.add_argument("-k", "--api_key", type=str, required=False, help="(Optional) NCBI API key, which permits 10 instead of 3 requests per second (default: environment variable NCBI_API_KEY)")
     args = parser.parse_args()
     main(args)
@@ -1,34 +1,59 @@
+import os
 import shutil
 import subprocess
 import logging
 
 class SelfBlasting:
 
-    def __init__(self, seq_FASTA, accession, logger = None):
+    # Static parts of the blastn command line; the tabular output only contains the length, query start, query end,
+    # subject start and subject end of each hit
+    BLAST_ARGS = ("-outfmt", "6 length qstart qend sstart send", "-strand", "both")
+
+    def __init__(self, seq_FASTA = None, accession = None, logger = None):
+        '''
+        An instance can be reused for several accessions by binding each accession via bind().
+        Params:
+         - seq_FASTA: (optional) file path to the complete sequence of the accession in FASTA format
+         - accession: (optional) accession number
+        '''
         if not shutil.which("blastn"):
             raise Exception("Error: 'blastn' not installed!")
         self.log = logger or logging.getLogger(__name__ + ".SelfBlasting")
-        self.seq_FASTA = seq_FASTA
+        self.seq_FASTA = None
+        self.accession = None
+        if seq_FASTA is not None:
+            self.bind(seq_FASTA, accession)
+
+    def bind(self, seq_FASTA, accession):
+        '''
+        Sets the accession to be self-BLASTed; returns the instance itself
+        Params:
+         - seq_FASTA: file path to the complete sequence of the accession in FASTA format
+         - accession: accession number
+        '''
+        self.seq_FASTA = os.path.abspath(seq_FASTA)
         self.accession = accession
-        self.filestem_db = self.accession + "_completeSeq" + "_blastdb"        
-        
-    def setup_blast_db(self):
-        mkblastargs = ["makeblastdb", "-in", self.seq_FASTA, "-parse_seqids", "-title", self.accession, "-dbtype", "nucl", "-out", self.filestem_db, "-logfile", self.filestem_db + ".log"]
-        mkblastdb_subp = subprocess.Popen(mkblastargs)
-        returncode = mkblastdb_subp.wait()
-        if returncode != 0: # Can probably be done prettier
-            raise Exception
+        return self
         
     def infer_irs(self, minlength, maxlength):
-        blastargs = ["blastn", "-db", self.filestem_db, "-query", self.seq_FASTA, "-outfmt", "7", "-strand", "both"]
-        blast_subp = subprocess.Popen(blastargs, stdout=subprocess.PIPE)
-        awkargs = ["awk", "{if ($4 > " + str(minlength) + " && $4 < " + str(maxlength) + ") print $4, $7, $8, $9, $10}"]
-        awk_subp = subprocess.Popen(awkargs, stdin=blast_subp.stdout, stdout=subprocess.PIPE)
-        out, err = awk_subp.communicate()
-        return out.splitlines()
-        
-    def compress_db(self):
-        tarargs = ["tar", "czf", self.filestem_db+"_FILES.tar.gz", self.filestem_db+".*", "--remove-files"] # "--remove-files" must be at end
-        returncode = subprocess.call(" ".join(tarargs), shell=True) # Shell=True is necessary for the wildcard
-        if returncode != 0:                                     # Can probably be done prettier
-            raise Exception("Non-zero exit status")             # Error message of subprocess.call is not transferred to exception (because shell=True is set above, but the latter is necessary)
+        '''
+        Searches the sequence against itself as subject, so that no BLAST database needs to be set up
+        Params:
+         - minlength, maxlength: length limits of the hits to be reported
+        '''
+        blastargs = ["blastn", "-subject", self.seq_FASTA, "-query", self.seq_FASTA, *self.BLAST_ARGS]
+        # The output is parsed while blastn is running; the hits within the length limits are kept as
+        # tuples of integers (length, query start, query end, subject start, subject end)
+        result_hits = []
+        with subprocess.Popen(blastargs, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as blast_subp:
+            for line in blast_subp.stdout:
+                hit = tuple(map(int, line.split("\t")))
+                if minlength < hit[0] < maxlength:
+                    result_hits.append(hit)
+            # blastn only writes (short) warnings and error messages to stderr, which are read once stdout is exhausted
+            blast_stderr = blast_subp.stderr.read().strip()
+        if blast_subp.returncode != 0:
+            raise Exception("blastn exited with status %s: %s" % (blast_subp.returncode, blast_stderr))
+        if blast_stderr:
+            self.log.debug("blastn reported for accession `%s`: %s" % (self.accession, blast_stderr))
+        return result_hits
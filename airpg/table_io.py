@@ -1,15 +1,37 @@
-import os, logging
+import os, csv, logging
 import pandas as pd
 
+try:
+    import pyarrow, pyarrow.parquet  # Optional; enables the Parquet copies of the tables and the multithreaded CSV reader
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Options of pd.read_csv for the tab-separated tables; the C engine reads the file via a memory map and the accession
+# numbers directly as strings, neither of which the pyarrow engine supports (its per-column dtypes fail on any
+# integer column with empty fields, such as SEQ_LEN)
+CSV_READ_OPTIONS = {"engine": "pyarrow"} if HAS_PYARROW else {"engine": "c", "memory_map": True, "dtype": {"ACCESSION": str}}
+
+# Columns of the tables, in the order in which they are written; the first column is the index
+ENTRY_COLUMNS = ("UID", "ACCESSION", "VERSION", "ORGANISM", "SEQ_LEN", "CREATE_DATE", "AUTHORS", "TITLE", "REFERENCE", "NOTE", "TAXONOMY")
+IR_COLUMNS = ("ACCESSION", "IRa_REPORTED", "IRa_REPORTED_START", "IRa_REPORTED_END", "IRa_REPORTED_LENGTH", "IRb_REPORTED", "IRb_REPORTED_START", "IRb_REPORTED_END", "IRb_REPORTED_LENGTH")
+BLAST_COLUMNS = IR_COLUMNS + ("IRa_BLASTINFERRED", "IRa_BLASTINFERRED_START", "IRa_BLASTINFERRED_END", "IRa_BLASTINFERRED_LENGTH", "IRb_BLASTINFERRED", "IRb_BLASTINFERRED_START", "IRb_BLASTINFERRED_END", "IRb_BLASTINFERRED_LENGTH")
+
 class TableIO:
 
+    # Number of rows appended one by one that are buffered before they are written to file at once; rows are only
+    # buffered while the TableIO is used as context manager
+    FLUSH_SIZE = 1000
+
     def __init__(self, fp_entry_table = None, fp_ir_table = None, fp_blast_table = None, fp_blocklist = None, fp_duplicates = None, logger = None):
         self.log = logger or logging.getLogger(__name__ + ".TableIO")
         self.entry_table = None
         self.duplicates = {}
         self.ir_table = None
         self.blast_table = None
-        self.blocklist = []
+        self.blocklist = set()
+        self._pending_rows = {}  # Rows not yet written to file; file path -> (column names, list of row dicts)
+        self._buffer_depth = 0  # Number of currently entered with-blocks of the TableIO
 
         if fp_entry_table:
             self.read_entry_table(os.path.abspath(fp_entry_table))
@@ -34,10 +56,9 @@ class TableIO:
          - fp_entry_table: file path to input file
         '''
         if os.path.isfile(fp_entry_table):
-            self.entry_table = pd.read_csv(fp_entry_table, sep = '\t', index_col = 0, encoding = 'utf-8')  # Index column is UID (i.e., column 0)
+            self.entry_table = self._read_table(fp_entry_table)  # Index column is UID (i.e., column 0)
         else:
-            columns = ["UID", "ACCESSION", "VERSION", "ORGANISM", "SEQ_LEN", "CREATE_DATE", "AUTHORS", "TITLE", "REFERENCE", "NOTE", "TAXONOMY"]
-            self.entry_table = pd.DataFrame(columns = columns)
+            self.entry_table = pd.DataFrame(columns = list(ENTRY_COLUMNS))
             self.entry_table = self.entry_table.set_index("UID", drop = True)
             self.write_entry_table(fp_entry_table)
 
@@ -51,28 +72,92 @@ class TableIO:
             self.entry_table.to_csv(fp_entry_table, sep = '\t', encoding = 'utf-8', header = False, mode = "a")
         else:
             self.entry_table.to_csv(fp_entry_table, sep = '\t', encoding = 'utf-8', header = True)
+            self._write_parquet(self.entry_table, fp_entry_table)
 
     def append_entry_to_table(self, entry, uid, fp_entry_table):
         '''
-        Write information on one GenBank entry to tab-separated file
+        Write information on one GenBank entry to tab-separated file. Within a with-block of the TableIO, the entry
+        is buffered and written together with other entries when the block is left (or flush() is called).
         Params:
          - entry: dict. Keys are column names
          - uid: Unique identifier for this GenBank entry
          - fp_entry_table: file path to output file
         '''
+        if fp_entry_table in self._pending_rows or os.path.isfile(fp_entry_table):  # Only stat the file if no rows of it are buffered yet
+            # Sort by columns by pre-defined order
+            self._buffer_row(fp_entry_table, ENTRY_COLUMNS, dict(entry, UID = str(uid)))
+        else:
+            raise Exception("Error trying to append GenBank entry to file '%s': File does not exist!" % (fp_entry_table))
+
+    def append_entries_to_table(self, entries, fp_entry_table, update_table = True):
+        '''
+        Add information on several GenBank entries to the entry table and write them to tab-separated file at once
+        Params:
+         - entries: dict. Keys are UIDs, values are dicts whose keys are column names
+         - fp_entry_table: file path to output file
+         - update_table: if False, the entries are only written to file, not added to the entry table in memory
+        '''
         if os.path.isfile(fp_entry_table):
-            handle_dict = dict()
-            handle_dict["UID"] = [str(uid)]
-            for key, value in entry.items():
-                handle_dict[key] = [value]    # Converting each value into a separate list (important for pandas)
-            handle_df = pd.DataFrame(handle_dict)
-			# Sort by columns by pre-defined order
-            columns = ["UID", "ACCESSION", "VERSION", "ORGANISM", "SEQ_LEN", "CREATE_DATE", "AUTHORS", "TITLE", "REFERENCE", "NOTE", "TAXONOMY"]
-            handle_df = handle_df[columns]
-            handle_df = handle_df.set_index("UID", drop = True)
+            handle_df = pd.DataFrame.from_dict(entries, orient = "index")
+            # Sort by columns by pre-defined order
+            handle_df = handle_df.reindex(columns = self.entry_table.columns)
+            handle_df.index.name = "UID"
+            if update_table and len(self.entry_table) > 0:
+                self.entry_table = pd.concat([self.entry_table, handle_df])
+            elif update_table:
+                self.entry_table = handle_df
             handle_df.to_csv(fp_entry_table, sep = '\t', header = False, encoding = 'utf-8', mode = "a")
         else:
-            raise Exception("Error trying to append GenBank entry to file '%s': File does not exist!" % (fp_entry_table))
+            raise Exception("Error trying to append GenBank entries to file '%s': File does not exist!" % (fp_entry_table))
+
+    def _tsv_stamp(self, fp_table):
+        '''
+        Returns the size and the modification time (in ns) of a tab-separated file as bytes, which identify the
+        state of the file a Parquet copy was made from
+        '''
+        stat = os.stat(fp_table)
+        return ("%s:%s" % (stat.st_size, stat.st_mtime_ns)).encode()
+
+    def _read_table(self, fp_table):
+        '''
+        Read a tab-separated table; if a Parquet copy of the table exists that was made from the tab-separated
+        file in its current state (i.e., the file has neither been appended to nor otherwise changed since),
+        the Parquet copy is read instead
+        Params:
+         - fp_table: file path to tab-separated input file
+        '''
+        self.flush()  # Rows buffered within a with-block are written first, so that they are read as well
+        fp_parquet = fp_table + ".parquet"
+        if HAS_PYARROW and os.path.isfile(fp_parquet):
+            metadata = pyarrow.parquet.read_schema(fp_parquet).metadata or {}
+            if metadata.get(b"airpg_tsv_stamp") == self._tsv_stamp(fp_table):
+                return pyarrow.parquet.read_table(fp_parquet).to_pandas()
+        table = pd.read_csv(fp_table, sep = '\t', index_col = 0, encoding = 'utf-8', **CSV_READ_OPTIONS)
+        if "ACCESSION" in table.columns and "dtype" not in CSV_READ_OPTIONS:
+            table["ACCESSION"] = table["ACCESSION"].astype(str)
+        return table
+
+    def _write_parquet(self, table, fp_table):
+        '''
+        Write a Parquet copy of a table next to its tab-separated file, if pyarrow is installed. The copy records
+        the size and the modification time of the tab-separated file, so that it is only read as long as the
+        tab-separated file is unchanged
+        Params:
+         - table: pandas DataFrame
+         - fp_table: file path to tab-separated output file (already written)
+        '''
+        if not HAS_PYARROW:
+            return
+        fp_parquet = fp_table + ".parquet"
+        try:
+            arrow_table = pyarrow.Table.from_pandas(table)
+            arrow_table = arrow_table.replace_schema_metadata(dict(arrow_table.schema.metadata or {}, airpg_tsv_stamp = self._tsv_stamp(fp_table)))
+            pyarrow.parquet.write_table(arrow_table, fp_parquet, compression = "zstd")
+        except Exception as err:
+            # Columns of mixed types cannot be stored in Parquet; an outdated copy must not be read later on
+            self.log.debug("Could not write Parquet copy of '%s': %s" % (fp_table, str(err)))
+            if os.path.isfile(fp_parquet):
+                os.remove(fp_parquet)
 
     def read_ir_table(self, fp_ir_table):
         '''
@@ -82,10 +167,9 @@ class TableIO:
          - fp_ir_table: file path to input file
         '''
         if os.path.isfile(fp_ir_table):
-            self.ir_table = pd.read_csv(fp_ir_table, sep = '\t', index_col = 0, encoding = 'utf-8')
+            self.ir_table = self._read_table(fp_ir_table)
         else:
-            columns = ["ACCESSION", "IRa_REPORTED", "IRa_REPORTED_START", "IRa_REPORTED_END", "IRa_REPORTED_LENGTH", "IRb_REPORTED", "IRb_REPORTED_START", "IRb_REPORTED_END", "IRb_REPORTED_LENGTH"]
-            self.ir_table = pd.DataFrame(columns = columns)
+            self.ir_table = pd.DataFrame(columns = list(IR_COLUMNS))
             self.ir_table = self.ir_table.set_index("ACCESSION", drop = True)
             self.write_ir_table(fp_ir_table)
 
@@ -99,22 +183,22 @@ class TableIO:
             self.ir_table.to_csv(fp_ir_table, sep = '\t', encoding = 'utf-8', header = False, mode = "a")
         else:
             self.ir_table.to_csv(fp_ir_table, sep = '\t', encoding = 'utf-8', header = True)
+            self._write_parquet(self.ir_table, fp_ir_table)
 
     def append_ir_info_to_table(self, ir_info, accession, fp_ir_table):
         '''
-        Write information on one accession's inverted repeats to tab-separated file
+        Write information on one accession's inverted repeats to tab-separated file. Within a with-block of the
+        TableIO, the information is buffered and written together with that of other accessions when the block is
+        left (or flush() is called).
         Params:
          - ir_info: dict. Keys are column names
          - accession: accession number of this record
          - fp_ir_table: file path to output file
         '''
-        if os.path.isfile(fp_ir_table):
-            for key, value in ir_info.items():
-                ir_info[key] = [value]
-            ir_info["ACCESSION"] = [accession]
-            handle_df = pd.DataFrame(ir_info)
-            handle_df = handle_df.set_index("ACCESSION", drop = True)
-            handle_df.to_csv(fp_ir_table, sep = '\t', header = False, encoding = 'utf-8', mode = "a")
+        if fp_ir_table in self._pending_rows or os.path.isfile(fp_ir_table):
+            # Order the columns as in the header of the file
+            columns = ["ACCESSION"] + (list(self.ir_table.columns) if self.ir_table is not None else list(ir_info.keys()))
+            self._buffer_row(fp_ir_table, columns, dict(ir_info, ACCESSION = accession))
         else:
             raise Exception("Error trying to append IR info to file '%s': File does not exist!" % (fp_ir_table))
         
@@ -126,26 +210,9 @@ class TableIO:
          - fp_blast_table: file path to input file
         '''
         if os.path.isfile(fp_blast_table):
-            self.blast_table = pd.read_csv(fp_blast_table, sep = '\t', index_col = 0, encoding = 'utf-8')
+            self.blast_table = self._read_table(fp_blast_table)
         else:
-            columns = ["ACCESSION", 
-                        "IRa_REPORTED", 
-                        "IRa_REPORTED_START", 
-                        "IRa_REPORTED_END", 
-                        "IRa_REPORTED_LENGTH", 
-                        "IRb_REPORTED", 
-                        "IRb_REPORTED_START", 
-                        "IRb_REPORTED_END", 
-                        "IRb_REPORTED_LENGTH",
-                        "IRa_BLASTINFERRED",
-                        "IRa_BLASTINFERRED_START",
-                        "IRa_BLASTINFERRED_END",
-                        "IRa_BLASTINFERRED_LENGTH",
-                        "IRb_BLASTINFERRED",
-                        "IRb_BLASTINFERRED_START",
-                        "IRb_BLASTINFERRED_END",
-                        "IRb_BLASTINFERRED_LENGTH"]
-            self.blast_table = pd.DataFrame(columns = columns)
+            self.blast_table = pd.DataFrame(columns = list(BLAST_COLUMNS))
             self.blast_table = self.blast_table.set_index("ACCESSION", drop = True)
             self.write_blast_table(fp_blast_table)
     
@@ -159,25 +226,84 @@ class TableIO:
             self.blast_table.to_csv(fp_blast_table, sep = '\t', encoding = 'utf-8', header = False, mode = "a")
         else:
             self.blast_table.to_csv(fp_blast_table, sep = '\t', encoding = 'utf-8', header = True)
+            self._write_parquet(self.blast_table, fp_blast_table)
     
     def append_blast_info_to_table(self, blast_info, accession, fp_blast_table):
         '''
-        Write information on one accession's inverted repeats to tab-separated file
+        Write information on one accession's inverted repeats to tab-separated file. Within a with-block of the
+        TableIO, the information is buffered and written together with that of other accessions when the block is
+        left (or flush() is called).
         Params:
          - blast_info: dict. Keys are column names
          - accession: accession number of this record
          - fp_blast_table: file path to output file
         '''
+        if fp_blast_table in self._pending_rows or os.path.isfile(fp_blast_table):
+            # Order the columns as in the header of the file
+            columns = ["ACCESSION"] + (list(self.blast_table.columns) if self.blast_table is not None else list(blast_info.keys()))
+            self._buffer_row(fp_blast_table, columns, dict(blast_info, ACCESSION = accession))
+        else:
+            raise Exception("Error trying to append IR info to file '%s': File does not exist!" % (fp_blast_table))
+    
+    def append_blast_infos_to_table(self, blast_infos, fp_blast_table):
+        '''
+        Write information on several accessions' inverted repeats to tab-separated file. The rows are written
+        and flushed one at a time as they are generated, so that neither the rows need to be held in memory
+        nor are the rows written so far lost if the run is interrupted.
+        Params:
+         - blast_infos: iterable of (accession number, dict) pairs. Keys of the dicts are column names
+         - fp_blast_table: file path to output file
+        '''
         if os.path.isfile(fp_blast_table):
-            for key, value in blast_info.items():
-                blast_info[key] = [value]
-            blast_info["ACCESSION"] = [accession]
-            handle_df = pd.DataFrame(blast_info)
-            handle_df = handle_df.set_index("ACCESSION", drop = True)
-            handle_df.to_csv(fp_blast_table, sep = '\t', header = False, encoding = 'utf-8', mode = "a")
+            # Order the columns as in the header of the file
+            columns = list(self.blast_table.columns) if self.blast_table is not None else None
+            with open(fp_blast_table, "a", encoding = 'utf-8', newline = '') as fh_blast_table:
+                writer = None
+                for accession, blast_info in blast_infos:
+                    if writer is None:
+                        writer = csv.DictWriter(fh_blast_table, fieldnames = ["ACCESSION"] + (columns or list(blast_info.keys())), delimiter = '\t', lineterminator = '\n', extrasaction = 'ignore')
+                    row = {key: ("" if pd.isna(value) else value) for key, value in blast_info.items()}  # Missing values are written as empty fields, as by pandas
+                    row["ACCESSION"] = accession
+                    writer.writerow(row)
+                    fh_blast_table.flush()
         else:
             raise Exception("Error trying to append IR info to file '%s': File does not exist!" % (fp_blast_table))
     
+    def _buffer_row(self, fp_table, columns, row):
+        '''
+        Buffer a row to be appended to a tab-separated file; the buffer is written once it holds FLUSH_SIZE rows,
+        or immediately if the TableIO is not used as context manager
+        '''
+        rows = self._pending_rows.setdefault(fp_table, (columns, []))[1]
+        rows.append(row)
+        if len(rows) >= self.FLUSH_SIZE or self._buffer_depth == 0:
+            self._write_rows(fp_table)
+
+    def _write_rows(self, fp_table):
+        '''
+        Append the buffered rows of a tab-separated file to it with a single write
+        '''
+        columns, rows = self._pending_rows.pop(fp_table)
+        with open(fp_table, "a", encoding = 'utf-8', newline = '') as fh_table:
+            writer = csv.DictWriter(fh_table, fieldnames = columns, delimiter = '\t', lineterminator = '\n', extrasaction = 'ignore')
+            # Missing values are written as empty fields, as by pandas
+            writer.writerows({key: ("" if pd.isna(value) else value) for key, value in row.items()} for row in rows)
+
+    def flush(self):
+        '''
+        Write all buffered rows to their files
+        '''
+        for fp_table in list(self._pending_rows.keys()):
+            self._write_rows(fp_table)
+
+    def __enter__(self):
+        self._buffer_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._buffer_depth -= 1
+        self.flush()
+
     def read_blocklist(self, fp_blocklist):
         '''
         Read a file of blocklisted genera.
@@ -185,14 +311,9 @@ class TableIO:
          - fp_blocklist: file path to input file
         '''
         with open(fp_blocklist, "r") as fh_blocklist:
-            blocklisted_taxa = set()
-            for line in [l.strip() for l in fh_blocklist.readlines()]:
-                if not line.startswith("#"):
-                    blocklisted_taxa.add(line.split(" ")[0])  # Taking only genus names
-            if isinstance(blocklisted_taxa, set):
-                self.blocklist.extend(blocklisted_taxa)
-            else:
-                self.blocklist.extend(list(blocklisted_taxa))
+            # Taking only genus names; comment lines and empty lines are skipped
+            blocklisted_taxa = frozenset(line.split()[0] for line in fh_blocklist if line.strip() and not line.lstrip().startswith("#"))
+        self.blocklist.update(blocklisted_taxa)
 
     def read_duplicates(self, fp_duplicates):
         '''
@@ -201,8 +322,8 @@ class TableIO:
          - fp_duplicates: file path to input file
         '''
         with open(fp_duplicates, "r") as fh_duplicates:
-            for dup_tup in [line.rstrip().split('\t') for line in fh_duplicates.readlines()]:
-                self.duplicates[dup_tup[0]] = [dup_tup[1], dup_tup[2]]
+            # The file is read line by line rather than into a list of lines first
+            self.duplicates.update((dup_tup[0], [dup_tup[1], dup_tup[2]]) for dup_tup in (line.rstrip().split('\t') for line in fh_duplicates))
 
     def write_duplicates(self, fp_duplicates):
         '''
@@ -211,8 +332,7 @@ class TableIO:
          - fp_duplicates: file path to output file
         '''
         with open(fp_duplicates, "w") as fh_duplicates:
-            for d_key in self.duplicates.keys():
-                fh_duplicates.write("%s\t%s\t%s\n" % (str(d_key), str(self.duplicates[d_key][0]), str(self.duplicates[d_key][1])))
+            fh_duplicates.write("".join("%s\t%s\t%s\n" % (d_key, d_val[0], d_val[1]) for d_key, d_val in self.duplicates.items()))
 
     def append_duplicates(self, fp_duplicates):
         '''
@@ -221,58 +341,73 @@ class TableIO:
          - fp_duplicates: file path to output file
         '''
         with open(fp_duplicates, "a") as fh_duplicates:
-            for d_key in self.duplicates.keys():
-                fh_duplicates.write("%s\t%s\t%s\n" % (str(d_key), str(self.duplicates[d_key][0]), str(self.duplicates[d_key][1])))
+            fh_duplicates.write("".join("%s\t%s\t%s\n" % (d_key, d_val[0], d_val[1]) for d_key, d_val in self.duplicates.items()))
 
     #####################
     # List edit methods #
     #####################
 
+    def last_taxa(self):
+        '''
+        Returns the last taxon of the taxonomy of each entry of the entry table (i.e., the genus) as Series,
+        stripped of surrounding dots and spaces
+        '''
+        return self.entry_table["TAXONOMY"].str.rsplit(';', n = 1).str[-1].str.strip('. ')
+
     def remove_naturally_irl_genera(self, genera_list):
         '''
         Remove entries from ir_table that belong to a genus that naturally lacks one or both IRs.
         '''
-        genus_accessions = {}
-        for genus in genera_list:
-            # get accessions from entry_table where ORGANISM starts with genus
-            # check if these accession have two reported IRs in ir_table
-            # if not, remove it from ir_table
-            genus_accessions[genus] = list(self.entry_table.loc[[(entry[-1].rstrip('.') == genus) for entry in self.entry_table["TAXONOMY"].str.split(';')]]["ACCESSION"])
-        self.log.debug("Found %s accessions that belong to potential IR-lacking genera." % str(sum(len(genus_accessions[x]) for x in genus_accessions)))
-        for genus, accessions in genus_accessions.items():
-            lacks_irs = True
-            i = 0
-            while lacks_irs == True and i < len(accessions):
-                if self.ir_table[accessions[i]]["IRa_REPORTED"] == "yes" and self.ir_table[accessions[i]]["IRb_REPORTED"] == "yes":
-                    lacks_irs = False
-                    self.log.debug("Found an entry with two reported IRs for " + str(genus))
-                i += 1
-            if lacks_irs:
-                self.log.debug("Dropping accessions for genus " + str(genus))
-                for accession in accessions:
-                    self.log.debug("Dropping accession " + str(accession))
-                    self.ir_table.drop(accession, inplace=True)
+        if not genera_list:
+            self.log.debug("No potential IR-lacking genera. No entries removed.")
+            return
+        # get accessions from entry_table whose genus is in the genera list (in a single pass over the table)
+        # check per genus if any of these accessions has two reported IRs in ir_table
+        # if not, remove the accessions of the genus from ir_table
+        last_taxa = self.last_taxa()
+        in_genera = last_taxa.isin(set(genera_list))
+        # Genus of each of these accessions; accessions without IR information are ignored
+        accession_genera = pd.Series(last_taxa[in_genera].values, index = self.entry_table.loc[in_genera, "ACCESSION"].values)
+        accession_genera = accession_genera[~accession_genera.index.duplicated()]
+        accession_genera = accession_genera[accession_genera.index.isin(self.ir_table.index)]
+        self.log.debug("Found %s accessions that belong to potential IR-lacking genera." % str(len(accession_genera)))
+        # Whether an accession has two reported IRs, and whether any accession of its genus has
+        both_irs = (self.ir_table.loc[accession_genera.index, ["IRa_REPORTED", "IRb_REPORTED"]] == "yes").all(axis = 1)
+        genus_has_both_irs = both_irs.groupby(accession_genera.reindex(both_irs.index).values).transform("any")
+        accessions_to_drop = both_irs.index[~genus_has_both_irs.values]
+        self.log.debug("Dropping %s accessions of genera without any entry with two reported IRs." % str(len(accessions_to_drop)))
+        self.ir_table.drop(index = accessions_to_drop, inplace = True)
 
     def remove_blocklisted_entries(self):
         '''
         Remove entries from entry table that match blocklisted genera.
         '''
-        for blocklist_entry in self.blocklist:
-            # TM: The next line took a while to figure out, so for the sake of my own and future contributers' sanities, here's a breakdown of what it does:
-            # self.entry_table["TAXONOMY"].str provides the whole taxonomy column for elementwise(i.e. rowwise) string operations. Since our TAXONOMY information is semicolon-separated, each row is split.
-            # This results in a Series of string lists. The last element (the genus) of each string list is compared to the current genus from the blocklist (entry[-1].rstrip('.') == genus).
-            # This in turn results in a list of bools, making self.entry_table.loc return all rows where the list of bools has True (i.e. all entries that match a blocklisted entry)
-            # Finally, we want only the index of those rows, to tell the dataframe which ones should get dropped.
-            genus_name = blocklist_entry.lower()
-            self.entry_table.drop(self.entry_table.loc[[(entry[-1].strip('. ').lower() == genus_name) for entry in self.entry_table["TAXONOMY"].str.split(';')]].index, inplace = True)
-            self.entry_table.drop(self.entry_table.loc[[(entry.lower() == genus_name) for entry in self.entry_table["ORGANISM"]]].index, inplace = True)
         if len(self.blocklist) == 0:
             self.log.info("Blocklist is empty. No entries removed.")
+            return
+        # An entry is blocklisted if the last taxon of its taxonomy (i.e., the genus) or its organism name equals a blocklisted genus.
+        # Both columns are compared against the set of blocklisted genera in a single vectorized pass each, instead of once per blocklisted genus.
+        genus_names = set(blocklist_entry.lower() for blocklist_entry in self.blocklist)
+        blocklisted = self.last_taxa().str.lower().isin(genus_names) | self.entry_table["ORGANISM"].str.lower().isin(genus_names)
+        self.entry_table.drop(self.entry_table.index[blocklisted], inplace = True)
 
     def remove_duplicates(self):
         '''
-        Remove entries from entry table that match duplicate accession numbers
-        '''
+        Remove entries from entry table that match duplicate accession numbers: if both the RefSeq accession
+        and the regular accession of a duplicate pair are in the entry table, the regular accession is removed
+        >>> tio = TableIO()
+        >>> tio.entry_table = pd.DataFrame({"ACCESSION": ["NC_000001", "AB000001", "AB000002", "AB000003"]}, index = [1, 2, 3, 4])
+        >>> tio.duplicates = {"1": ["NC_000001", "AB000001"], "5": ["AB000003", "NC_000005"]}
+        >>> tio.remove_duplicates()
+        >>> list(tio.entry_table["ACCESSION"])
+        ['NC_000001', 'AB000002', 'AB000003']
+        '''
+        if not self.duplicates:
+            self.log.debug("No duplicates known. No entries removed.")
+            return
+        # The accession numbers are looked up in a set of the column values (a membership test on the Series itself would check its index, i.e. the UIDs)
+        accessions = set(self.entry_table["ACCESSION"])
+        regular_accs = set()
         for d_key in self.duplicates.keys():
             if 'NC_' in self.duplicates[d_key][0]:
                 refseq_acc = self.duplicates[d_key][0]
@@ -280,6 +415,8 @@ class TableIO:
             else:
                 refseq_acc = self.duplicates[d_key][1]
                 regular_acc = self.duplicates[d_key][0]
-            if refseq_acc in self.entry_table["ACCESSION"] and regular_acc in self.entry_table["ACCESSION"]:
-                self.entry_table.drop(self.entry_table.loc[self.entry_table["ACCESSION"] == regular_acc].index, inplace = True)
+            if refseq_acc in accessions and regular_acc in accessions:
+                regular_accs.add(regular_acc)
                 self.log.info("Entry for accession `%s` removed because it is a duplicate with `%s`" % (regular_acc, refseq_acc))
+        # All duplicates are dropped at once
+        self.entry_table.drop(self.entry_table.index[self.entry_table["ACCESSION"].isin(regular_accs)], inplace = True)
@@ -29,7 +29,7 @@ setuptools.setup(
     #entry_points={
     #  "console_scripts": ["airpg-identify=airpg.scripts.airpg_identify", "airpg-analyze=airpg.scripts.airpg_analyze", "airpg-confirm=airpg.scripts.airpg_confirm", "airpg-update-blocklist=airpg.scripts.airpg_update_blocklist"]
     #},
-    install_requires=['biopython', 'ete3', 'entrezpy', 'pandas', 'fuzzywuzzy', 'coloredlogs', 'python-Levenshtein'],
+    install_requires=['biopython>=1.81', 'ete3', 'entrezpy', 'pandas', 'rapidfuzz', 'coloredlogs'],
     scripts=['airpg/scripts/airpg_identify.py', 'airpg/scripts/airpg_analyze.py', 'airpg/scripts/airpg_confirm.py', 'airpg/scripts/airpg_update_blocklist.py'],
     test_suite='setup.my_test_suite',
     include_package_data=True,